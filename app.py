@@ -1,20 +1,116 @@
-from flask import Flask, request, jsonify, send_file, redirect, url_for, session, render_template
+from flask import Flask, Request, Response, request, jsonify, send_file, redirect, url_for, session, render_template, stream_template
 from flask_session import Session
-from io import BytesIO
 import uuid
 import os
+import hashlib
 import traceback
 import subprocess
-from config import logger
+import tempfile
+from datetime import datetime
+from config import (logger, SESSION_FILE_DIR, PRERENDER_WEEKS, STREAM_RESULT_PAGE, ASYNC_UPLOADS, JOB_RETRY_AFTER,
+                    BATCH_MAX_FILES, MAX_CONTENT_LENGTH, UPLOAD_DIR, COMPRESS_RESPONSES)
+from batch import process_batch
 from excel_handler import process_excel
-from render_table import render_attendance_table
+from jobs import NO_ATTENDANCE_ERROR, QueueFullError, read_status, submit_job
+from result_cache import get_result_cache
+from result_store import get_result_store
+from compression import COMPRESSIBLE_TYPES, compress_response, negotiate, should_compress
+from cube import LEVELS, PERIODS
+from metrics import finish_request, render_metrics, start_request, timed
+from output_workbook import get_output_path
+from week_api import history_payload, roster_payload, stats_payload, trends_payload, week_payload
+from week_tables import get_compressed_week_table, get_week_table, iter_week_table, prerender_weeks
+from werkzeug.exceptions import RequestEntityTooLarge
+
+class SpooledRequest(Request):
+    """Request whose uploaded files are always written straight to a temporary file in UPLOAD_DIR."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # 保留副檔名，soffice 轉檔時依此判斷格式；請求結束關閉檔案時自動刪除
+        suffix = os.path.splitext(filename)[1].lower() if filename else ''
+        return tempfile.NamedTemporaryFile('wb+', dir=UPLOAD_DIR, suffix=suffix)
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+# 超過上限的請求由 Flask 回應 413
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH or None
 
 app.config['SESSION_TYPE'] = 'filesystem'
+# 多個 worker 行程共用同一個 session 目錄
+app.config['SESSION_FILE_DIR'] = SESSION_FILE_DIR
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 Session(app)
 
+# Flask-Session 在 after_request 之後才寫入 session，其耗時只記入 /metrics
+_save_session = app.session_interface.save_session
+
+def _timed_save_session(*args, **kwargs):
+    with timed('session'):
+        return _save_session(*args, **kwargs)
+
+app.session_interface.save_session = _timed_save_session
+
+@app.before_request
+def _start_timing():
+    start_request()
+
+@app.after_request
+def _add_server_timing(response):
+    server_timing = finish_request(request.endpoint)
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    return response
+
+# 帶內容雜湊的靜態檔網址內容不會改變，可長期快取
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+_asset_hashes = {}
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file with a hash of its content, so browsers can cache it indefinitely."""
+    digest = _asset_hashes.get(filename)
+    if digest is None:
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            digest = _asset_hashes[filename] = hashlib.sha1(f.read()).hexdigest()[:12]
+    return url_for('static', filename=filename, v=digest)
+
+@app.after_request
+def _cache_and_compress(response):
+    if request.endpoint == 'static' and 'v' in request.args:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    if COMPRESS_RESPONSES and response.mimetype in COMPRESSIBLE_TYPES:
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request)
+        if encoding and should_compress(response):
+            compress_response(response, encoding)
+    return response
+
+def _size_limit(limit):
+    # 向上取整，1 MiB 以下改以 KB（或位元組）表示，避免顯示「0 MB」
+    for unit, size in (('MB', 1024 * 1024), ('KB', 1024)):
+        if limit >= size:
+            return f"{-(-limit // size)} {unit}"
+    return f"{limit} bytes"
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    logger.error(f"Rejected upload larger than {MAX_CONTENT_LENGTH} bytes")
+    return jsonify({"error": f"Upload exceeds the {_size_limit(MAX_CONTENT_LENGTH)} limit"}), 413
+
+def spooled_path(file):
+    """Path of an uploaded file's temporary file (see SpooledRequest)."""
+    file.stream.flush()
+    return file.stream.name
+
+def warm_up():
+    """Compile the templates up front so pre-forked workers inherit them."""
+    for template in ('index.html', 'result.html', 'processing.html'):
+        app.jinja_env.get_template(template)
+
 def get_git_commit_id():
     try:
         with open('/app/commit_id.txt', 'r') as f:
@@ -50,22 +146,26 @@ def upload_file():
     file_extension = '.xls' if filename.endswith('.xls') else '.xlsx'
     
     try:
-        result = process_excel(file.stream, file_extension)
+        upload_path = spooled_path(file)
+        cache = get_result_cache()
+        result = None
+        if cache is not None:
+            cache_key = cache.key(upload_path, file_extension)
+            result = cache.get(cache_key)
+        if result is None and ASYNC_UPLOADS:
+            return _queue_upload(upload_path, file_extension, cache_key if cache is not None else None)
+        if result is None:
+            result = process_excel(upload_path, file_extension)
+            if cache is not None and result['all_attendance_data']:
+                cache.put(cache_key, result)
         
         if not result['all_attendance_data']:
             commit_id = get_git_commit_id()
-            return render_template('index.html', error="上傳的文件中無任何出席紀錄，請檢查數據後重新上傳。", commit_id=commit_id)
-
-        session['latest_analytic_date'] = result['latest_analytic_date']
-        session['latest_attendance_data'] = result['latest_attendance_data']
-        session['latest_week_display'] = result['latest_week_display']
-        session['latest_district_counts'] = result['latest_district_counts']
-        session['latest_main_district'] = result['latest_main_district']
-        session['latest_main_district_counts'] = result['latest_main_district_counts']
-        session['all_attendance_data'] = result['all_attendance_data']
-        
-        result['output_stream'].seek(0)
-        session['latest_file_stream'] = result['output_stream'].read()
+            return render_template('index.html', error=NO_ATTENDANCE_ERROR, commit_id=commit_id)
+
+        session['result_id'] = get_result_store().save(result)
+        if PRERENDER_WEEKS:
+            prerender_weeks(session['result_id'])
         
         return redirect(url_for('result'))
     except Exception as e:
@@ -73,77 +173,208 @@ def upload_file():
         logger.debug(f"Full traceback: {traceback.format_exc()}")
         return jsonify({"error": f"Processing failed: {str(e)}"}), 500
 
+@app.route('/upload_batch', methods=['POST'])
+def upload_batch():
+    # 多個大區的名單一次上傳，合併為一份報表
+    files = [f for f in request.files.getlist('files') if f and f.filename]
+    logger.info(f"Received batch upload request with {len(files)} files")
+    if not files:
+        logger.error("No files selected")
+        return jsonify({"error": "No files selected"}), 400
+    if len(files) > BATCH_MAX_FILES:
+        logger.error(f"Too many files in batch: {len(files)}")
+        return jsonify({"error": f"At most {BATCH_MAX_FILES} files can be analysed together"}), 400
+    for file in files:
+        if not file.filename.lower().endswith(('.xls', '.xlsx')):
+            logger.error(f"Invalid file format: {file.filename}")
+            return jsonify({"error": "Only .xls and .xlsx files are supported"}), 400
+
+    try:
+        uploads = []
+        for file in files:
+            file_extension = '.xls' if file.filename.lower().endswith('.xls') else '.xlsx'
+            uploads.append((spooled_path(file), file_extension, file.filename))
+        result = process_batch(uploads)
+
+        if not result['all_attendance_data']:
+            commit_id = get_git_commit_id()
+            return render_template('index.html', error=NO_ATTENDANCE_ERROR, commit_id=commit_id)
+
+        session['result_id'] = get_result_store().save(result)
+        if PRERENDER_WEEKS:
+            prerender_weeks(session['result_id'])
+
+        return redirect(url_for('result'))
+    except Exception as e:
+        logger.error(f"Batch processing error: {str(e)}")
+        logger.debug(f"Full traceback: {traceback.format_exc()}")
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+
+def _queue_upload(upload_path, file_extension, cache_key):
+    try:
+        job_id = submit_job(upload_path, file_extension, cache_key)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting upload: {str(e)}")
+        response = jsonify({"error": "Server is busy, please retry shortly"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+        return response
+    session['job_id'] = job_id
+    status_url = url_for('job_status', job_id=job_id)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({"job_id": job_id, "status_url": status_url}), 202
+    return render_template('processing.html', status_url=status_url, commit_id=get_git_commit_id()), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = read_status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    status.pop('owner', None)
+    if status['state'] == 'done':
+        # 只有提交此工作的 session 會取得結果
+        if session.get('job_id') == job_id:
+            session['result_id'] = status['result_id']
+            status['result_url'] = url_for('result')
+        del status['result_id']
+    return jsonify(status)
+
 @app.route('/result')
 def result():
-    latest_attendance_data = session.get('latest_attendance_data')
-    latest_week_display = session.get('latest_week_display', "No week data available yet")
-    latest_district_counts = session.get('latest_district_counts')
-    latest_main_district_counts = session.get('latest_main_district_counts')
-    all_attendance_data = session.get('all_attendance_data', [])
+    store = get_result_store()
+    result_id = session.get('result_id')
+    meta = store.load_meta(result_id)
+    if STREAM_RESULT_PAGE:
+        # 先送出頁面框架與週選單，再逐一送出各大區區塊
+        latest_sections = iter_week_table(result_id, meta['latest_week_idx']) if meta else None
+    else:
+        latest_table = get_week_table(result_id, meta['latest_week_idx']) if meta else None
+        latest_sections = [latest_table[0]] if latest_table else None
     
-    if not latest_attendance_data or not latest_attendance_data.get('attended'):
+    if not latest_sections:
         commit_id = get_git_commit_id()
         return render_template('index.html', error="最新週無有效出席數據，請檢查文件內容。", commit_id=commit_id)
-
-    all_attendance_data.sort(key=lambda x: x[0])
-    
-    attendance_table_html = render_attendance_table(
-        latest_week_display,
-        latest_attendance_data,
-        all_attendance_data,
-        latest_district_counts,
-        latest_main_district_counts
-    )
     
-    week_options = [(week_name, idx) for idx, (_, _, week_name) in enumerate(all_attendance_data)]
+    week_options = [(week_name, idx) for idx, (_, week_name) in enumerate(meta['weeks'])]
     
     commit_id = get_git_commit_id()
-    return render_template(
-        'result.html',
-        attendance_table_html=attendance_table_html,
+    context = dict(
+        attendance_table_sections=latest_sections,
         stats_table_html="",
-        has_file_stream='latest_file_stream' in session,
+        has_file_stream=store.has_output(result_id),
         week_options=week_options,
-        selected_week_idx=len(all_attendance_data) - 1 if all_attendance_data else 0,
+        selected_week_idx=len(meta['weeks']) - 1 if meta['weeks'] else 0,
         commit_id=commit_id
     )
+    if STREAM_RESULT_PAGE:
+        return stream_template('result.html', **context)
+    with timed('render'):
+        return render_template('result.html', **context)
 
 @app.route('/get_week_data/<int:week_idx>')
 def get_week_data(week_idx):
-    all_attendance_data = session.get('all_attendance_data', [])
-    latest_district_counts = session.get('latest_district_counts', {})
-    latest_main_district_counts = session.get('latest_main_district_counts', {})
+    # 可選擇與任一較早的週比較，預設為上一週
+    compare_idx = request.args.get('compare', type=int)
+    table = get_week_table(session.get('result_id'), week_idx, compare_idx)
     
-    if not all_attendance_data or week_idx < 0 or week_idx >= len(all_attendance_data):
+    if not table:
         return jsonify({
             'attendance_table': '<div class="district-section"><table class="excel-table"><tr class="title-row"><th>無資料</th></tr></table></div>'
         }), 400
     
-    _, attendance_data, week_name = all_attendance_data[week_idx]
-    
-    attendance_table_html = render_attendance_table(
-        week_name,
-        attendance_data,
-        all_attendance_data,
-        latest_district_counts,
-        latest_main_district_counts
-    )
+    attendance_table_html, etag = table
+    encoding = negotiate(request)
     
-    return jsonify({
+    response = jsonify({
         'attendance_table': attendance_table_html
     })
+    # 同一次上傳的資料不會改變，瀏覽器重複請求時以 ETag 回應 304；各編碼的 ETag 不同
+    response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    response = response.make_conditional(request)
+    if encoding and response.status_code == 200:
+        compress_response(response, encoding, get_compressed_week_table(
+            session.get('result_id'), week_idx, compare_idx, encoding, response.get_data()
+        ))
+    return response
+
+@app.route('/api/roster')
+def api_roster():
+    payload = roster_payload(session.get('result_id'))
+    if payload is None:
+        return jsonify({"error": "No analysis result available"}), 404
+    return jsonify(payload)
+
+@app.route('/api/weeks/<int:week_idx>')
+def api_week(week_idx):
+    # ?base=<idx>：只回傳與該週相比狀態有變動的成員
+    base_idx = request.args.get('base', type=int)
+    payload = week_payload(session.get('result_id'), week_idx, base_idx)
+    if payload is None:
+        return jsonify({"error": "Week not found"}), 404
+    response = jsonify(payload)
+    logger.info(f"Week API {'delta' if base_idx is not None else 'full'} payload for week {week_idx}: "
+                f"{response.content_length} bytes")
+    return response
+
+@app.route('/api/stats')
+def api_stats():
+    # ?period=month|quarter&level=main_district|district&start=YYYY-MM-DD&end=YYYY-MM-DD
+    period = request.args.get('period', 'month')
+    level = request.args.get('level', 'main_district')
+    if period not in PERIODS or level not in LEVELS:
+        return jsonify({"error": f"period must be one of {PERIODS}, level one of {LEVELS}"}), 400
+    try:
+        start, end = (datetime.strptime(request.args[key], '%Y-%m-%d') if key in request.args else None
+                      for key in ('start', 'end'))
+    except ValueError:
+        return jsonify({"error": "start and end must be YYYY-MM-DD dates"}), 400
+    payload = stats_payload(session.get('result_id'), period, level, start, end)
+    if payload is None:
+        return jsonify({"error": "No analysis result available"}), 404
+    return jsonify(payload)
+
+@app.route('/api/trends')
+def api_trends():
+    # ?week=<idx>：計算至該週為止的趨勢，預設為最新一週
+    week_idx = request.args.get('week', type=int)
+    payload = trends_payload(session.get('result_id'), week_idx)
+    if payload is None:
+        return jsonify({"error": "Week not found"}), 404
+    return jsonify(payload)
+
+@app.route('/api/history')
+def api_history():
+    # ?district=<區名>&start=YYYY-MM-DD&end=YYYY-MM-DD：跨上傳累積的每週各區出席人數
+    try:
+        start, end = (datetime.strptime(request.args[key], '%Y-%m-%d') if key in request.args else None
+                      for key in ('start', 'end'))
+    except ValueError:
+        return jsonify({"error": "start and end must be YYYY-MM-DD dates"}), 400
+    payload = history_payload(request.args.get('district'), start, end)
+    if payload is None:
+        return jsonify({"error": "Attendance history is disabled"}), 404
+    return jsonify(payload)
+
+@app.route('/metrics')
+def metrics():
+    # 加總所有 worker 與工作行程寫入 METRICS_DIR 的數據
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/download', methods=['GET'])
 def download_file():
-    if 'latest_file_stream' not in session:
+    # 輸出檔在第一次下載時才產生，之後直接由磁碟送出
+    output_path = get_output_path(session.get('result_id'))
+    if output_path is None:
         return jsonify({"error": "No processed file available"}), 404
-    file_stream = BytesIO(session['latest_file_stream'])
-    file_stream.seek(0)
+    # conditional：支援 ETag / If-Modified-Since 與 Range 續傳
     return send_file(
-        file_stream,
+        output_path,
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
         as_attachment=True,
-        download_name=f"analyzed_{uuid.uuid4().hex}.xlsx"
+        download_name=f"analyzed_{uuid.uuid4().hex}.xlsx",
+        conditional=True
     )
 
 if __name__ == '__main__':
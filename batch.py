@@ -0,0 +1,173 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import openpyxl
+from config import logger, START_COLUMN, AGE_CATEGORIES, BATCH_WORKERS
+from metrics import flush as flush_metrics, timed
+from excel_handler import (TREND_SHEET, analyse_roster, build_result, empty_result, open_input_workbook,
+                           summary_sheets_of, week_date, write_summary_streaming, write_trend_sheet, _no_progress)
+from history_store import record_history
+from roster import Roster, read_roster, MAIN_DISTRICT_COL, SUB_DISTRICT_COL, NAME_COL, AGE_COL
+from utils import peak_rss_kb
+
+COMBINED_SHEET = '合併名單'
+COUNTS_SHEET = '各區統計'
+SOURCE_COL = 2  # 合併名單中記錄來源檔名的欄位（read_roster 不讀此欄）
+
+
+def read_batch_file(path, file_extension):
+    """Parse one spooled upload into a Roster; runs in a pool worker."""
+    workbook, _ = open_input_workbook(path, file_extension, streaming=True)
+    try:
+        return read_roster(workbook.active)
+    finally:
+        workbook.close()
+        flush_metrics()
+
+
+def merge_rosters(named_rosters):
+    """
+    Concatenate the members of several rosters into one Roster whose week
+    columns are the union of their (month, week) labels in date order.
+
+    Returns (roster, sources) where ``sources`` is each member's file name.
+    When a file lacks some of the combined weeks, the roster's ``known`` mask
+    leaves its members out of those weeks instead of counting them absent.
+    """
+    labels = {}
+    for _, roster in named_rosters:
+        for _, week_name, month_prefix in roster.week_cols:
+            labels.setdefault((month_prefix, week_name), len(labels))
+    # 依日期排序；同一日期保留首次出現的順序
+    ordered = sorted(labels, key=lambda label: (week_date(*label)[0], labels[label]))
+    week_index = {label: idx for idx, label in enumerate(ordered)}
+    week_cols = [(START_COLUMN + idx, week_name, month_prefix) for idx, (month_prefix, week_name) in enumerate(ordered)]
+
+    total = sum(len(roster) for _, roster in named_rosters)
+    matrix = np.zeros((total, len(week_cols)), dtype=np.uint8)
+    known = np.zeros((total, len(week_cols)), dtype=np.uint8)
+    main_district = None
+    main_districts, districts, names, ages, sources = [], [], [], [], []
+    offset = 0
+    for filename, roster in named_rosters:
+        cols = [week_index[(month_prefix, week_name)] for _, week_name, month_prefix in roster.week_cols]
+        missing = len(week_cols) - len(set(cols))
+        if missing:
+            logger.warning(f"{filename} lacks {missing} of {len(week_cols)} combined weeks; "
+                           f"its members are left out of those weeks")
+        matrix[offset:offset + len(roster), cols] = roster.matrix
+        known[offset:offset + len(roster), cols] = 1
+        offset += len(roster)
+        if main_district is None:
+            main_district = roster.main_district
+        main_districts += roster.main_districts
+        districts += roster.districts
+        names += roster.names
+        ages += roster.ages
+        sources += [filename] * len(roster)
+
+    logger.info(f"Merged {len(named_rosters)} rosters: {total} members x {len(week_cols)} weeks")
+    # 每個檔案都有所有週時不需要遮罩
+    known = None if known.all() else known
+    return Roster(main_district, main_districts, districts, names, ages, week_cols, matrix, known), sources
+
+
+def _combined_rows(roster, sources):
+    """Rows of the merged roster in the same layout read_roster expects of an upload."""
+    month_row = [None] * (START_COLUMN + len(roster.week_cols))
+    week_row = list(month_row)
+    current_month = None
+    for col, week_name, month_prefix in roster.week_cols:
+        if month_prefix != current_month:
+            month_row[col] = current_month = month_prefix
+        week_row[col] = week_name
+    for col, label in ((MAIN_DISTRICT_COL, '大區'), (SUB_DISTRICT_COL, '小區'), (SOURCE_COL, '來源'),
+                       (NAME_COL, '姓名'), (AGE_COL, '年齡')):
+        week_row[col] = label
+    yield month_row
+    yield week_row
+
+    for member, name in enumerate(roster.names):
+        main_district_value = roster.main_districts[member]
+        row = [None] * START_COLUMN
+        row[MAIN_DISTRICT_COL] = main_district_value
+        row[SUB_DISTRICT_COL] = roster.districts[member][len(main_district_value):]
+        row[SOURCE_COL] = sources[member]
+        row[NAME_COL] = name
+        row[AGE_COL] = roster.ages[member]
+        yield row + [1 if present else None for present in roster.matrix[member].tolist()]
+
+
+def _counts_rows(roster, all_attendance_data):
+    """One row per week and main district with the attendance total and age breakdown."""
+    yield ['週', '大區', '總人數'] + AGE_CATEGORIES
+    for _, attendance_data, week_name in sorted(all_attendance_data, key=lambda x: x[0]):
+        present = roster.presence(attendance_data['attended_ids'])
+        _, main_district_counts = roster.week_counts(present)
+        for main_district_value, counts in main_district_counts.items():
+            yield [week_name, main_district_value, counts['total']] + [counts['ages'][age] for age in AGE_CATEGORIES]
+        overall = roster.age_counts(np.flatnonzero(present))
+        yield [week_name, '總計', overall['total']] + [overall['ages'][age] for age in AGE_CATEGORIES]
+
+
+def write_combined_workbook(output, roster, sources, all_attendance_data):
+    """
+    Write a batch's output workbook to ``output`` (a path or stream): the merged
+    roster, a per-week district/age count sheet, the weekly summary sheets and
+    the trend sheet.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    with timed('write_sheets'):
+        for title, rows in ((COMBINED_SHEET, _combined_rows(roster, sources)),
+                            (COUNTS_SHEET, _counts_rows(roster, all_attendance_data))):
+            sheet = workbook.create_sheet(title)
+            for row in rows:
+                sheet.append(row)
+        for new_sheet_name, attended, not_attended in summary_sheets_of(roster, all_attendance_data):
+            new_sheet = workbook.create_sheet(new_sheet_name)
+            logger.debug(f"Created new sheet: {new_sheet_name}")
+            write_summary_streaming(new_sheet, attended, not_attended)
+        write_trend_sheet(workbook.create_sheet(TREND_SHEET), roster, all_attendance_data)
+    with timed('save_workbook'):
+        workbook.save(output)
+
+
+def process_batch(uploads, progress=None):
+    """
+    Analyse several spooled uploads as one roster. ``uploads`` is a list of
+    (path, file_extension, filename); each file is parsed in a process pool,
+    the rosters are merged on their (month, week) labels and the combined
+    roster goes through the same classification as process_excel.
+
+    Returns a process_excel-style result; its output workbook is written by
+    write_combined_workbook on the first download.
+    """
+    if progress is None:
+        progress = _no_progress
+    started = time.perf_counter()
+    progress('parse', 0, len(uploads))
+    workers = max(1, min(BATCH_WORKERS, len(uploads)))
+    with timed('batch_parse'), ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(read_batch_file, path, file_extension) for path, file_extension, _ in uploads]
+        named_rosters = []
+        for done, (future, (_, _, filename)) in enumerate(zip(futures, uploads)):
+            try:
+                named_rosters.append((filename, future.result()))
+            except Exception as e:
+                logger.error(f"Failed to parse {filename}: {str(e)}")
+                raise ValueError(f"{filename}: {str(e)}") from e
+            progress('parse', done + 1, len(uploads))
+    logger.info(f"Parsed {len(uploads)} files with {workers} workers in {time.perf_counter() - started:.2f}s")
+
+    with timed('merge'):
+        roster, sources = merge_rosters(named_rosters)
+    with timed('classify'):
+        analysis = analyse_roster(roster, {COMBINED_SHEET, COUNTS_SHEET, TREND_SHEET}, progress)
+    if not analysis['all_attendance_data']:
+        logger.warning("No weeks with attendees found in the batch")
+        return empty_result(roster)
+
+    record_history(roster, analysis['all_attendance_data'])
+    logger.info(f"Batch of {len(uploads)} files processed in {time.perf_counter() - started:.2f}s "
+                f"(peak RSS {peak_rss_kb()} KB)")
+    return build_result(analysis, {'kind': 'batch', 'sources': sources}, roster)
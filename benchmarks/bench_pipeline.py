@@ -0,0 +1,179 @@
+"""
+Stage benchmark for the upload pipeline on synthetic rosters: time (best of
+``--repeat`` runs) and peak traced memory per stage, for each size.
+
+Results are compared with benchmarks/baseline.json; the run exits with status
+1 when a stage is slower or uses more memory than its baseline by more than
+``--tolerance``. Baselines are machine-specific: refresh them with
+``--save-baseline`` after an intended change or on new hardware.
+
+Usage: python benchmarks/bench_pipeline.py [--sizes small,medium] [--repeat 3]
+                                           [--tolerance 0.25] [--save-baseline]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+# 不寫入 metrics 檔
+os.environ['METRICS_DIR'] = ''
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.CRITICAL)
+
+import openpyxl
+from cube import AttendanceCube
+from excel_handler import analyse_roster, write_summary, write_summary_streaming
+from render_table import render_attendance_table
+from roster import read_roster
+from synthetic_roster import write_synthetic_roster
+from trends import compute_trends, week_matrix
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# (members, weeks, districts)
+SIZES = {
+    'small': (300, 26, 6),
+    'medium': (2000, 52, 10),
+    'large': (3000, 150, 12),
+}
+
+# 低於此差距的變化視為雜訊
+MIN_TIME_DELTA = 0.005
+MIN_MEMORY_DELTA = 1024 * 1024
+
+
+def pipeline(content):
+    """Yield (stage, callable) pairs; each callable runs one stage on the previous stages' output."""
+    state = {}
+
+    def load():
+        state['workbook'] = openpyxl.load_workbook(BytesIO(content), read_only=True)
+
+    def roster():
+        state['roster'] = read_roster(state['workbook'].active)
+        state['workbook'].close()
+
+    def classify():
+        state['analysis'] = analyse_roster(state['roster'], set())
+        state['data'] = sorted(state['analysis']['all_attendance_data'], key=lambda x: x[0])
+
+    def cube():
+        weeks = [(date, week_name) for date, _, week_name in state['data']]
+        state['cube'] = AttendanceCube(state['roster'], weeks)
+
+    def write_sheets():
+        workbook = openpyxl.Workbook()
+        for sheet_name, attended, not_attended in state['analysis']['summary_sheets']:
+            write_summary(workbook.create_sheet(sheet_name), attended, not_attended)
+        workbook.save(BytesIO())
+
+    def write_streaming():
+        workbook = openpyxl.Workbook(write_only=True)
+        for sheet_name, attended, not_attended in state['analysis']['summary_sheets']:
+            write_summary_streaming(workbook.create_sheet(sheet_name), attended, not_attended)
+        workbook.save(BytesIO())
+
+    def render():
+        week_idx = len(state['data']) - 1
+        _, attendance_data, week_name = state['data'][week_idx]
+        district_counts, main_district_counts = state['cube'].week_counts(week_idx)
+        render_attendance_table(week_name, attendance_data, state['data'][week_idx - 1:],
+                                district_counts, main_district_counts)
+
+    def trends():
+        compute_trends(week_matrix(state['roster'], [week_name for _, _, week_name in state['data']]))
+
+    return [('load', load), ('roster', roster), ('classify', classify), ('cube', cube),
+            ('write_sheets', write_sheets), ('write_streaming', write_streaming),
+            ('render', render), ('trends', trends)]
+
+
+def measure(content, repeat):
+    """{stage: {'seconds': best time, 'peak_bytes': peak traced memory}} for one workbook."""
+    results = {}
+    for _ in range(repeat):
+        for stage, run in pipeline(content):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            results.setdefault(stage, {'seconds': elapsed})
+            results[stage]['seconds'] = min(results[stage]['seconds'], elapsed)
+
+    # 記憶體另跑一次：tracemalloc 會拖慢執行，不與計時混用
+    tracemalloc.start()
+    try:
+        for stage, run in pipeline(content):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            run()
+            results[stage]['peak_bytes'] = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def regressions(size, results, baseline, tolerance):
+    found = []
+    for stage, current in results.items():
+        base = baseline.get(size, {}).get(stage)
+        if base is None:
+            continue
+        for key, min_delta in (('seconds', MIN_TIME_DELTA), ('peak_bytes', MIN_MEMORY_DELTA)):
+            if current[key] > base[key] * (1 + tolerance) and current[key] - base[key] > min_delta:
+                found.append(f"{size}/{stage}: {key} {base[key]:.4g} -> {current[key]:.4g}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='small,medium', help=f"comma-separated subset of {', '.join(SIZES)}")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    all_results = {}
+    failures = []
+    for size in args.sizes.split(','):
+        members, weeks, districts = SIZES[size]
+        stream = BytesIO()
+        write_synthetic_roster(stream, members, weeks, districts)
+        results = measure(stream.getvalue(), args.repeat)
+        all_results[size] = results
+
+        print(f"\n{size}: {members} members x {weeks} weeks, {districts} districts")
+        print(f"{'stage':<16}{'ms':>10}{'baseline':>10}{'peak MB':>10}{'baseline':>10}")
+        for stage, current in results.items():
+            base = baseline.get(size, {}).get(stage, {})
+            base_ms = f"{base['seconds'] * 1000:.1f}" if base else '-'
+            base_mb = f"{base['peak_bytes'] / 2 ** 20:.1f}" if base else '-'
+            print(f"{stage:<16}{current['seconds'] * 1000:>10.1f}{base_ms:>10}"
+                  f"{current['peak_bytes'] / 2 ** 20:>10.1f}{base_mb:>10}")
+        failures += regressions(size, results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        baseline.update(all_results)
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nbaseline saved to {BASELINE_PATH}")
+        return
+
+    if failures:
+        print("\nregressions beyond tolerance:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nno regressions")
+
+
+if __name__ == '__main__':
+    main()
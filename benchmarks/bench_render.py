@@ -0,0 +1,236 @@
+"""
+Micro-benchmark: join-based render_attendance_table vs. the previous
+string-concatenation renderer, on a synthetic 2,000-member roster.
+
+Usage: python benchmarks/bench_render.py [members] [weeks] [repeat]
+"""
+import logging
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.CRITICAL)
+
+import numpy as np
+from config import AGE_CATEGORIES
+from excel_handler import classify_attendance
+from render_table import EMPTY_IDS, render_attendance_table
+from roster import Roster
+from utils import chinese_to_int, parse_district
+
+NUMERALS = '一二三四五六七八九十'
+
+
+def synthetic_weeks(members, weeks, seed=0):
+    """Build all_attendance_data for a random roster of two main districts x five sub-districts."""
+    rng = random.Random(seed)
+    main_districts = [f"{NUMERALS[rng.randrange(1, 3)]}大區" for _ in range(members)]
+    districts = [f"{main}{NUMERALS[rng.randrange(5)]}" for main in main_districts]
+    names = [f"成員{i:05d}" for i in range(members)]
+    ages = [rng.choice(AGE_CATEGORIES) for _ in range(members)]
+    week_cols = [(8 + i, '第一週', '2025年1月') for i in range(weeks)]
+    matrix = (np.random.default_rng(seed).random((members, weeks)) < 0.6).astype(np.uint8)
+    roster = Roster(main_districts[0], main_districts, districts, names, ages, week_cols, matrix)
+
+    all_attendance_data = []
+    for week_idx in range(weeks):
+        (attended, not_attended, district_counts, _, main_district_counts,
+         attended_ids, not_attended_ids) = classify_attendance(roster, week_idx)
+        attendance_data = {'attended': attended, 'not_attended': not_attended,
+                           'attended_ids': attended_ids, 'not_attended_ids': not_attended_ids}
+        all_attendance_data.append((datetime(2025, 1, 5) + timedelta(weeks=week_idx), attendance_data,
+                                    f"week{week_idx:03d}"))
+    return all_attendance_data, district_counts, main_district_counts
+
+
+
+def render_attendance_table_legacy(week_display, latest_attendance_data, all_attendance_data, latest_district_counts, latest_main_district_counts, compare_week_display=None):
+    """The previous string-concatenation renderer, kept as the reference output."""
+    # 獲取所有區域名稱
+    all_districts = set(latest_attendance_data['attended'].keys()).union(latest_attendance_data['not_attended'].keys())
+    
+    # 只保留具體子區（排除僅有大區的鍵）
+    districts = sorted(
+        [d for d in all_districts if len(parse_district(d)) > 1 and parse_district(d)[1]],  # 確保有子區資訊且子區非空
+        key=parse_district
+    )
+    
+    if not districts:
+        return """
+        <div class="district-section">
+            <table class="excel-table">
+                <tr class="title-row"><th>該週無有效數據</th></tr>
+            </table>
+        </div>
+        """
+
+    previous_week_data = None
+    all_attendance_data.sort(key=lambda x: x[0])
+    if compare_week_display is not None:
+        previous_week_data = next((data for date, data, week_name in all_attendance_data if week_name == compare_week_display), None)
+    else:
+        current_week_idx = next((idx for idx, (date, data, week_name) in enumerate(all_attendance_data) if week_name == week_display), None)
+        if current_week_idx is not None and current_week_idx > 0:
+            previous_week_data = all_attendance_data[current_week_idx - 1][1]
+            compare_week_display = all_attendance_data[current_week_idx - 1][2]
+
+    main_districts = sorted(set(parse_district(d)[0] for d in districts), key=lambda x: chinese_to_int(x[0]))
+    district_groups = {md: [d for d in districts if d.startswith(md)] for md in main_districts}
+
+    # 標題註明比較的週次
+    compare_note = f'（比較：{compare_week_display}）' if previous_week_data else ''
+
+    html = ""
+    age_categories = ['青職以上', '大專', '中學', '大學', '小學', '學齡前']
+
+    for main_district in main_districts:
+        sub_districts = district_groups[main_district]
+        if not sub_districts:
+            continue
+
+        max_len = max(max(len(latest_attendance_data['attended'].get(d, [])), len(latest_attendance_data['not_attended'].get(d, []))) for d in sub_districts)
+
+        sorted_attended = {}
+        sorted_not_attended = {}
+        for district in sub_districts:
+            attended_list = latest_attendance_data['attended'].get(district, [])
+            not_attended_list = latest_attendance_data['not_attended'].get(district, [])
+            
+            attended_with_highlights = []
+            not_attended_with_highlights = []
+            if previous_week_data:
+                # 本週到會且比較週未到會 → 綠；本週未到會且比較週到會 → 紅
+                newly_attending = np.isin(
+                    latest_attendance_data['attended_ids'].get(district, EMPTY_IDS),
+                    previous_week_data['not_attended_ids'].get(district, EMPTY_IDS),
+                    assume_unique=True
+                ).tolist()
+                newly_absent = np.isin(
+                    latest_attendance_data['not_attended_ids'].get(district, EMPTY_IDS),
+                    previous_week_data['attended_ids'].get(district, EMPTY_IDS),
+                    assume_unique=True
+                ).tolist()
+                
+                for name, is_new in zip(attended_list, newly_attending):
+                    display_name = name[:4] if len(name) > 4 else name
+                    highlight = 'highlight-green' if is_new else ''
+                    attended_with_highlights.append((name, display_name, highlight))
+                
+                for name, is_new in zip(not_attended_list, newly_absent):
+                    display_name = name[:4] if len(name) > 4 else name
+                    highlight = 'highlight-red' if is_new else ''
+                    not_attended_with_highlights.append((name, display_name, highlight))
+            else:
+                attended_with_highlights = [(name, name[:4] if len(name) > 4 else name, '') for name in attended_list]
+                not_attended_with_highlights = [(name, name[:4] if len(name) > 4 else name, '') for name in not_attended_list]
+            
+            attended_with_highlights.sort(key=lambda x: (x[2] == '', x[0]))
+            not_attended_with_highlights.sort(key=lambda x: (x[2] == '', x[0]))
+            
+            sorted_attended[district] = attended_with_highlights
+            sorted_not_attended[district] = not_attended_with_highlights
+
+        # 開始大區區塊
+        html += f'<div class="district-section">\n'
+        html += f'<h2>{main_district} - {week_display}{compare_note}</h2>\n'
+        html += '<div class="district-container">\n'
+
+        # 出勤名單表
+        html += '<div class="table-wrapper attendance-wrapper">\n<table class="excel-table">\n'
+        total_cols = len(sub_districts) * 2
+        html += f'<tr class="header"><th colspan="{total_cols}">{main_district}</th></tr>\n'
+        html += '<tr class="district-row">\n'
+        for district in sub_districts:
+            html += f'<th colspan="2">{district}</th>'
+        html += '</tr>\n'
+        html += '<tr class="subheader">\n'
+        for _ in sub_districts:
+            html += '<th>本週到會</th><th>未到會</th>'
+        html += '</tr>\n'
+
+        for r in range(max_len):
+            row_class = "even" if r % 2 == 0 else "odd"
+            html += f'<tr class="{row_class}">\n'
+            for district in sub_districts:
+                attended_with_highlights = sorted_attended.get(district, [])
+                not_attended_with_highlights = sorted_not_attended.get(district, [])
+                attended_info = attended_with_highlights[r] if r < len(attended_with_highlights) else ('', '', '')
+                not_attended_info = not_attended_with_highlights[r] if r < len(not_attended_with_highlights) else ('', '', '')
+                attended_display = attended_info[1]
+                not_attended_display = not_attended_info[1]
+                attended_class = attended_info[2]
+                not_attended_class = not_attended_info[2]
+                html += f'<td class="{attended_class}">{attended_display}</td><td class="{not_attended_class}">{not_attended_display}</td>'
+            html += '</tr>\n'
+        html += '</table>\n</div>\n'
+
+        # 統計表（總計移至標題行並染色）
+        stats_districts = sorted([d for d in latest_district_counts.keys() if d != '總計'], key=parse_district)
+        sub_districts_stats = [d for d in stats_districts if d.startswith(main_district)]
+        if sub_districts_stats:
+            html += '<div class="table-wrapper stats-wrapper">\n<table class="excel-table">\n'
+            html += f'<tr class="header"><th colspan="2">{main_district} 統計</th></tr>\n'
+            row_index = 0
+            
+            # 子區統計
+            for district in sub_districts_stats:
+                total = latest_district_counts[district]['total']
+                html += f'<tr class="total-row"><td style="padding-left: 15px;">{district}</td><td>{total}</td></tr>\n'
+                row_index += 1
+                for age in age_categories:
+                    count = latest_district_counts[district]['ages'][age]
+                    row_class = "even" if row_index % 2 == 0 else "odd"
+                    html += f'<tr class="{row_class}"><td style="padding-left: 30px;">{age}</td><td>{count}</td></tr>\n'
+                    row_index += 1
+            
+            # 主區統計
+            total = latest_main_district_counts[main_district]['total']
+            html += f'<tr class="total-row"><td style="padding-left: 15px;">{main_district}</td><td>{total}</td></tr>\n'
+            row_index += 1
+            for age in age_categories:
+                count = latest_main_district_counts[main_district]['ages'][age]
+                row_class = "even" if row_index % 2 == 0 else "odd"
+                html += f'<tr class="{row_class}"><td style="padding-left: 30px;">{age}</td><td>{count}</td></tr>\n'
+                row_index += 1
+
+            html += '</table>\n</div>\n'
+
+        html += '</div>\n</div>\n'
+
+    if not html:
+        html = """
+        <div class="district-section">
+            <table class="excel-table">
+                <tr class="title-row"><th>該週無有效數據</th></tr>
+            </table>
+        </div>
+        """
+
+    return html
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    weeks = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    all_attendance_data, district_counts, main_district_counts = synthetic_weeks(members, weeks)
+
+    # 兩者輸出必須逐位元組相同
+    for _, data, week_name in all_attendance_data:
+        for compare in (None, all_attendance_data[0][2]):
+            args = (week_name, data, list(all_attendance_data), district_counts, main_district_counts, compare)
+            assert render_attendance_table(*args) == render_attendance_table_legacy(*args), week_name
+    print(f"outputs identical for {weeks} weeks x 2 comparison modes")
+
+    _, data, week_name = all_attendance_data[-1]
+    args = (week_name, data, all_attendance_data, district_counts, main_district_counts)
+    for label, fn in (("legacy", render_attendance_table_legacy), ("join", render_attendance_table)):
+        best = min(timeit.repeat(lambda: fn(*args), number=1, repeat=repeat))
+        print(f"{label:>6}: {best * 1000:8.1f} ms per render ({members} members)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Deterministic synthetic roster workbooks in the upload layout: labels in row 1,
+"年/月" month headers in row 1 and "第N週" week headers in row 2 from
+START_COLUMN on, one member per row from row 3.
+
+Usage: python benchmarks/synthetic_roster.py OUTPUT.xlsx [members] [weeks] [districts] [seed]
+"""
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openpyxl
+from config import START_COLUMN, AGE_CATEGORIES, YOUTH_ABOVE
+
+NUMERALS = '一二三四五六七八九十'
+LABELS = ['大區', '小區', '排', '姓名', '性別', '年齡', '電話', '備註']
+# 原始年齡欄的值：青職以上的各種寫法、其餘類別，以及偶爾的空白
+RAW_AGES = sorted(YOUTH_ABOVE) + AGE_CATEGORIES[1:] + ['']
+
+
+def sundays(weeks, start=date(2024, 1, 7)):
+    """[(month_header, week_header)] for ``weeks`` consecutive Sundays."""
+    headers = []
+    for i in range(weeks):
+        day = start + timedelta(weeks=i)
+        headers.append((f"{day.year}年{day.month}月", f"第{NUMERALS[(day.day - 1) // 7]}週"))
+    return headers
+
+
+def synthetic_rows(members, weeks, districts, seed=0):
+    """
+    Yield the worksheet rows. ``districts`` sub-districts are spread over at
+    least two main districts (at most ten sub-districts each); each member
+    gets a fixed attendance rate so streaks and rates look realistic.
+    """
+    rng = random.Random(seed)
+    main_count = max(2, (districts + len(NUMERALS) - 1) // len(NUMERALS))
+    sub_districts = [(f"{NUMERALS[i % main_count + 1]}大區", NUMERALS[i // main_count]) for i in range(districts)]
+
+    month_row = LABELS + [None] * (START_COLUMN - len(LABELS) + weeks)
+    week_row = [None] * (START_COLUMN + weeks)
+    previous_month = None
+    for i, (month_header, week_header) in enumerate(sundays(weeks)):
+        if month_header != previous_month:
+            month_row[START_COLUMN + i] = previous_month = month_header
+        week_row[START_COLUMN + i] = week_header
+    yield month_row
+    yield week_row
+
+    for member in range(members):
+        main_district, sub_district = sub_districts[rng.randrange(districts)]
+        rate = rng.choice((0.2, 0.5, 0.8, 0.95))
+        row = [main_district, sub_district, rng.randint(1, 5), f"成員{member:05d}", rng.choice('男女'),
+               rng.choice(RAW_AGES), None, None]
+        row += [None] * (START_COLUMN - len(row))
+        row += [1 if rng.random() < rate else None for _ in range(weeks)]
+        yield row
+
+
+def write_synthetic_roster(output, members, weeks, districts, seed=0):
+    """Write a synthetic roster to ``output`` (a path or binary stream)."""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('名單')
+    for row in synthetic_rows(members, weeks, districts, seed):
+        sheet.append(row)
+    workbook.save(output)
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    members = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    weeks = int(sys.argv[3]) if len(sys.argv) > 3 else 52
+    districts = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+    seed = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+    write_synthetic_roster(sys.argv[1], members, weeks, districts, seed)
+    print(f"wrote {sys.argv[1]}: {members} members x {weeks} weeks, {districts} districts")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import gzip
+import zlib
+from config import COMPRESS_RESPONSES, COMPRESS_MIN_SIZE
+
+try:
+    import brotli
+except ImportError:  # 未安裝 brotli 時只提供 gzip
+    brotli = None
+
+# 依偏好順序；brotli 壓縮率較高
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+# 串流回應累積至少此數量的未壓縮位元組才同步送出，避免每個小片段都產生一次 flush
+STREAM_FLUSH_BYTES = 4096
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript')
+
+
+def negotiate(request):
+    """The preferred encoding among those the client accepts, or None."""
+    if not COMPRESS_RESPONSES:
+        return None
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data, encoding, best=False):
+    """Compress ``data``; ``best`` spends more CPU for a smaller body, for bodies that are cached."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+class _StreamCompressor:
+    """
+    Incremental compressor that sync-flushes once STREAM_FLUSH_BYTES of input
+    are pending, so what has been sent so far is decodable on its own.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self._pending = 0
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=5)
+        else:
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        self._pending += len(chunk)
+        flush = self._pending >= STREAM_FLUSH_BYTES
+        if flush:
+            self._pending = 0
+        if self.encoding == 'br':
+            data = self._compressor.process(chunk)
+            return data + self._compressor.flush() if flush else data
+        data = self._compressor.compress(chunk)
+        return data + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else data
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def _iter_compressed(chunks, encoding):
+    compressor = _StreamCompressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_response(response, encoding, body=None):
+    """
+    Encode ``response`` with ``encoding`` in place. ``body`` is an already
+    compressed body (e.g. from a cache); streamed responses are compressed
+    chunk by chunk so they still arrive progressively.
+    """
+    if response.is_streamed:
+        response.response = _iter_compressed(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(body if body is not None else compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+
+
+def should_compress(response):
+    """Whether an outgoing response is text worth compressing and not already encoded."""
+    if response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return False
+    return response.is_streamed or (response.content_length or 0) >= COMPRESS_MIN_SIZE
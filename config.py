@@ -1,9 +1,74 @@
 # config.py
 import logging
+import os
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging（LOG_LEVEL=DEBUG 會額外記錄每週完整名單，大型檔案上會明顯變慢）
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Constants
 START_COLUMN = 8
+AGE_CATEGORIES = ['青職以上', '大專', '中學', '大學', '小學', '學齡前']
+YOUTH_ABOVE = {'年長', '中壯', '青壯', '青職'}
+# 出席趨勢：近 N 週出席率的視窗，以及列入關懷名單的連續缺席週數
+TREND_WINDOWS = (4, 8, 12)
+AT_RISK_STREAK = 3
+
+# 低記憶體模式：以 write_only 產生輸出檔（原工作表僅保留數值）；分析時一律以 read_only 讀取上傳檔
+STREAMING_WORKBOOK = os.getenv('STREAMING_WORKBOOK', '0') == '1'
+
+# LibreOffice 轉檔池（需安裝 unoserver）；SOFFICE_POOL_SIZE=0 時每次上傳啟動一個 soffice
+# 轉檔池屬於各 gunicorn worker：全站共 SOFFICE_POOL_SIZE × worker 數個 soffice
+SOFFICE_POOL_SIZE = int(os.getenv('SOFFICE_POOL_SIZE', '0'))
+SOFFICE_QUEUE_SIZE = int(os.getenv('SOFFICE_QUEUE_SIZE', '8'))
+SOFFICE_TIMEOUT = int(os.getenv('SOFFICE_TIMEOUT', '60'))
+UNOSERVER_COMMAND = os.getenv('UNOSERVER_COMMAND', 'unoserver')
+
+# 上傳結果快取（以檔案內容雜湊為鍵）；RESULT_CACHE_MAX_BYTES=0 表示停用
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', os.path.join(os.getcwd(), 'result_cache'))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', str(24 * 60 * 60)))
+
+# 分析結果存放區；session 只保存結果 ID
+RESULT_STORE_DIR = os.getenv('RESULT_STORE_DIR', os.path.join(os.getcwd(), 'results'))
+RESULT_STORE_TTL = int(os.getenv('RESULT_STORE_TTL', str(24 * 60 * 60)))
+RESULT_STORE_LRU_SIZE = int(os.getenv('RESULT_STORE_LRU_SIZE', '64'))
+
+# 上傳後於背景預先產生每一週的表格
+PRERENDER_WEEKS = os.getenv('PRERENDER_WEEKS', '0') == '1'
+
+# /result 以分段（chunked）方式回應，逐一送出各大區區塊
+STREAM_RESULT_PAGE = os.getenv('STREAM_RESULT_PAGE', '0') == '1'
+
+# 非同步上傳：/upload 只將檔案排入處理佇列並回傳 job ID，由 /jobs/<id> 查詢進度
+ASYNC_UPLOADS = os.getenv('ASYNC_UPLOADS', '0') == '1'
+# JOB_WORKERS 為每個 gunicorn worker 的處理行程數；JOB_QUEUE_SIZE 為全站排隊及處理中的工作上限（依 JOB_DIR 計算）
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '1'))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '8'))
+JOB_RETRY_AFTER = int(os.getenv('JOB_RETRY_AFTER', '10'))
+JOB_DIR = os.getenv('JOB_DIR', os.path.join(os.getcwd(), 'jobs'))
+# 排隊或處理中的工作超過此秒數未更新狀態（或所屬 worker 已結束）即視為失敗
+JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', '1800'))
+
+# Flask-Session 檔案目錄（多個 worker 行程需指向同一處）
+SESSION_FILE_DIR = os.getenv('SESSION_FILE_DIR', os.path.join(os.getcwd(), 'flask_session'))
+
+# 多檔合併分析：各檔案於行程池中平行解析；BATCH_WORKERS 預設為 CPU 核心數
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', str(os.cpu_count() or 1)))
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '32'))
+
+# 各行程的耗時統計寫入此目錄，由 /metrics 加總；設為空字串則只回報處理該請求的行程
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(os.getcwd(), 'metrics'))
+
+# 上傳大小上限（位元組，整個請求），超過時回應 413；設為 0 表示不限制
+MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', str(32 * 1024 * 1024)))
+# 上傳檔直接寫入此目錄的暫存檔；與結果、快取目錄同一檔案系統時可改以硬連結保存
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', os.path.join(os.getcwd(), 'uploads'))
+
+# 跨上傳累積的出席歷史（SQLite 檔）；設為空字串則停用
+HISTORY_DB = os.getenv('HISTORY_DB', os.path.join(os.getcwd(), 'history.sqlite3'))
+
+# 依 Accept-Encoding 以 brotli／gzip 壓縮 HTML、JSON 等回應；小於 COMPRESS_MIN_SIZE 位元組的回應不壓縮
+COMPRESS_RESPONSES = os.getenv('COMPRESS_RESPONSES', '1') == '1'
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
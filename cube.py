@@ -0,0 +1,146 @@
+import numpy as np
+from config import AGE_CATEGORIES
+from trends import known_matrix, week_matrix
+
+PERIODS = ('month', 'quarter')
+LEVELS = ('main_district', 'district')
+
+
+class AttendanceCube:
+    """
+    Attendance counts per sub-district × age category × week, built once per
+    upload from the roster matrix, with main-district rollups.
+
+    Weeks are indexed like the result's weeks (date order), so any week's
+    stats table or a range aggregate is a slice of ``counts`` instead of a
+    pass over the name lists. For a merged roster whose files lack some
+    weeks, ``reported`` marks the weeks each sub-district has records for.
+    """
+
+    def __init__(self, roster, weeks):
+        self.weeks = weeks                            # [(date, week_name), ...]
+        self.districts = list(roster.district_ids)    # 與 Roster.week_counts 相同的順序
+        self.main_districts = list(roster.main_district_ids)
+
+        # 每位成員的 (區, 年齡) 組合，以 one-hot 矩陣乘上出席矩陣一次算出所有週
+        district_codes = np.empty(len(roster), dtype=np.int64)
+        for code, ids in enumerate(roster.district_ids.values()):
+            district_codes[ids] = code
+        cells = district_codes * len(AGE_CATEGORIES) + roster.age_codes
+        one_hot = np.zeros((len(self.districts) * len(AGE_CATEGORIES), len(roster)), dtype=np.int32)
+        one_hot[cells, np.arange(len(roster))] = 1
+        week_names = [week_name for _, week_name in weeks]
+        present = week_matrix(roster, week_names).astype(np.int32)
+        self.counts = (one_hot @ present).reshape(len(self.districts), len(AGE_CATEGORIES), len(weeks))
+
+        # 各區所屬的大區；大區統計為其所有區的加總
+        main_code = {main_district: code for code, main_district in enumerate(self.main_districts)}
+        self.parents = np.array([main_code[roster.main_districts[ids[0]]] for ids in roster.district_ids.values()],
+                                dtype=np.int64)
+        self.main_counts = np.zeros((len(self.main_districts), len(AGE_CATEGORIES), len(weeks)), dtype=np.int32)
+        np.add.at(self.main_counts, self.parents, self.counts)
+
+        # 各區每週是否有紀錄；None 表示每區每週都有
+        known = known_matrix(roster, week_names)
+        self.reported = None
+        if known is not None:
+            recorded = np.zeros((len(self.districts), len(weeks)), dtype=np.int32)
+            np.add.at(recorded, district_codes, known.astype(np.int32))
+            self.reported = recorded > 0
+
+    @staticmethod
+    def _counts(ages):
+        ages = ages.tolist()
+        return {'total': sum(ages), 'ages': dict(zip(AGE_CATEGORIES, ages))}
+
+    def week_counts(self, week_idx):
+        """(district_counts, main_district_counts) of one week, in Roster.week_counts' format."""
+        district_counts = {}
+        for district, ages in zip(self.districts, self.counts[:, :, week_idx]):
+            if ages.any():
+                district_counts[district] = self._counts(ages)
+        main_district_counts = {}
+        for main_district, ages in zip(self.main_districts, self.main_counts[:, :, week_idx]):
+            if ages.any():
+                main_district_counts[main_district] = self._counts(ages)
+        district_counts['總計'] = sum(d['total'] for d in district_counts.values())
+        return district_counts, main_district_counts
+
+    def week_range(self, start=None, end=None):
+        """Indices of the weeks whose date falls within [start, end] (either bound may be None)."""
+        return [idx for idx, (date, _) in enumerate(self.weeks)
+                if (start is None or date >= start) and (end is None or date <= end)]
+
+    def _groups(self, level):
+        if level == 'district':
+            return self.districts, self.counts
+        return self.main_districts, self.main_counts
+
+    def _averages(self, level, idxs):
+        """
+        Average weekly counts per group at ``level`` over the weeks ``idxs``,
+        plus a mask of the groups with records in any of those weeks. A
+        sub-district's weeks without records are left out of its average;
+        main districts add up their sub-districts' averages.
+        """
+        groups, counts = self._groups(level)
+        reported = getattr(self, 'reported', None)
+        if reported is None:
+            return counts[:, :, idxs].mean(axis=2), np.ones(len(groups), dtype=bool)
+        weeks = reported[:, idxs]
+        recorded = weeks.sum(axis=1)
+        averages = (self.counts[:, :, idxs] * weeks[:, None, :]).sum(axis=2) / np.maximum(recorded, 1)[:, None]
+        if level == 'district':
+            return averages, recorded > 0
+        main_averages = np.zeros((len(self.main_districts), len(AGE_CATEGORIES)))
+        np.add.at(main_averages, self.parents, averages)
+        main_reported = np.zeros(len(self.main_districts), dtype=bool)
+        np.logical_or.at(main_reported, self.parents, recorded > 0)
+        return main_averages, main_reported
+
+    def period_summary(self, period='month', level='main_district', start=None, end=None):
+        """
+        Average weekly attendance per ``period`` ('month' or 'quarter') for each
+        group at ``level`` plus '總計', with the change in the average total
+        relative to the previous period (None for the first period or a zero base).
+
+        Groups without records in a period (a merged file lacking those weeks)
+        are left out of that period, of '總計' and of the next period's base;
+        the change of '總計' only compares groups recorded in both periods.
+        """
+        groups, _ = self._groups(level)
+        buckets = {}
+        for idx in self.week_range(start, end):
+            date = self.weeks[idx][0]
+            label = f"{date.year}年{date.month}月" if period == 'month' else f"{date.year}年Q{(date.month - 1) // 3 + 1}"
+            buckets.setdefault(label, []).append(idx)
+
+        summary = []
+        previous = {}
+        for label, idxs in buckets.items():
+            averages, has_records = self._averages(level, idxs)
+            by_group = {
+                group: {'total': round(float(ages.sum()), 2), 'ages': dict(zip(AGE_CATEGORIES, np.round(ages, 2).tolist()))}
+                for group, ages, recorded in zip(groups, averages, has_records) if recorded
+            }
+            overall = averages[has_records].sum(axis=0)
+            by_group['總計'] = {'total': round(float(overall.sum()), 2),
+                               'ages': dict(zip(AGE_CATEGORIES, np.round(overall, 2).tolist()))}
+            totals = {group: float(ages.sum()) for group, ages, recorded in zip(groups, averages, has_records) if recorded}
+            change = {}
+            for group, total in totals.items():
+                base = previous.get(group, 0)
+                change[group] = round((total - base) / base, 4) if base else None
+            # 總計只比較兩期都有紀錄的群組
+            common = [group for group in totals if group in previous]
+            base = sum(previous[group] for group in common)
+            current = sum(totals[group] for group in common)
+            change['總計'] = round((current - base) / base, 4) if base else None
+            summary.append({
+                'period': label,
+                'weeks': [self.weeks[idx][1] for idx in idxs],
+                'average': by_group,
+                'change': change,
+            })
+            previous = totals
+        return summary
@@ -1,136 +1,127 @@
+import logging
 import os
+import shutil
 import subprocess
 import tempfile
-from io import BytesIO
+import time
 from datetime import datetime
 import openpyxl
-from openpyxl.styles import PatternFill, Font, Alignment
-from config import logger, START_COLUMN
-from utils import chinese_to_int
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Alignment, NamedStyle
+from config import logger, STREAMING_WORKBOOK, SOFFICE_TIMEOUT
+from history_store import record_history
+from metrics import timed
+from roster import read_roster
+from soffice_pool import get_pool
+from trends import trend_rows
+from xls_reader import open_xls_workbook
+from utils import chinese_to_int, peak_rss_kb
 
-def convert_xls_to_xlsx(file_stream):
-    """Convert .xls to .xlsx using soffice command."""
-    logger.info("Converting .xls to .xlsx using soffice")
-    file_stream.seek(0)
-    file_content = file_stream.read()
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.xls') as temp_xls:
-        temp_xls.write(file_content)
-        temp_xls_path = temp_xls.name
-
-    temp_xlsx_path = temp_xls_path.replace('.xls', '.xlsx')
+TREND_SHEET = '出席趨勢'
 
+def _convert_with_soffice(temp_xls_path, outdir):
+    """Cold path: one soffice process per upload, with its own throwaway profile."""
+    profile_dir = tempfile.mkdtemp(prefix='soffice-profile-')
     try:
-        result = subprocess.run([
+        subprocess.run([
             'soffice',
+            f'-env:UserInstallation=file://{profile_dir}',
             '--headless',
             '--convert-to',
             'xlsx',
             temp_xls_path,
             '--outdir',
-            os.path.dirname(temp_xls_path)
-        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        logger.info(f"Successfully converted {temp_xls_path} to {temp_xlsx_path}")
+            outdir
+        ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=SOFFICE_TIMEOUT)
+    finally:
+        shutil.rmtree(profile_dir, ignore_errors=True)
 
-        if not os.path.exists(temp_xlsx_path):
+def convert_xls_to_xlsx(xls_path, output_dir):
+    """
+    Convert an .xls file into ``output_dir`` through the LibreOffice pool, or a
+    one-off soffice. Returns the path of the converted .xlsx.
+    """
+    xlsx_path = os.path.join(output_dir, os.path.splitext(os.path.basename(xls_path))[0] + '.xlsx')
+
+    try:
+        pool = get_pool()
+        started = time.perf_counter()
+        if pool is not None:
+            logger.info(f"Converting .xls to .xlsx using LibreOffice pool (queue depth {pool.queue_depth})")
+            pool.convert(xls_path, xlsx_path)
+        else:
+            logger.info("Converting .xls to .xlsx using soffice")
+            _convert_with_soffice(xls_path, output_dir)
+        logger.info(f"Successfully converted {xls_path} to {xlsx_path} in {time.perf_counter() - started:.2f}s")
+
+        if not os.path.exists(xlsx_path):
             logger.error("Converted .xlsx file not found after soffice conversion")
             raise Exception("Conversion failed: Output file not found")
-
-        with open(temp_xlsx_path, 'rb') as temp_xlsx:
-            output_stream = BytesIO(temp_xlsx.read())
-        return output_stream
+        return xlsx_path
 
     except subprocess.CalledProcessError as e:
         logger.error(f"Failed to convert .xls to .xlsx: {e.stderr.decode()}")
         raise Exception(f"Failed to convert .xls to .xlsx: {e.stderr.decode()}")
+    except subprocess.TimeoutExpired:
+        logger.error(f"soffice did not finish within {SOFFICE_TIMEOUT}s")
+        raise Exception(f"Failed to convert .xls to .xlsx: timed out after {SOFFICE_TIMEOUT}s")
     except Exception as e:
         logger.error(f"Unexpected error during conversion: {str(e)}")
         raise
-    finally:
-        if os.path.exists(temp_xls_path):
-            os.remove(temp_xls_path)
-        if os.path.exists(temp_xlsx_path):
-            os.remove(temp_xlsx_path)
-
-def classify_attendance(sheet, week_col):
-    main_district = None
-    logger.debug(f"Classifying attendance for week column: {week_col}")
-    attended = {}
-    not_attended = {}
-    district_counts = {}
-    main_district_counts = {}
-    youth_above = {'年長', '中壯', '青壯', '青職'}
-    age_categories = ['青職以上', '大專', '中學', '大學', '小學', '學齡前']
-    max_row = sheet.max_row
-    
-    for row in range(3, max_row + 1):
-        main_district_value = str(sheet.cell(row, 1).value or "").strip()
-        sub_district = str(sheet.cell(row, 2).value or "").strip()
-        district = f"{main_district_value}{sub_district}"
-        name = sheet.cell(row, 4).value
-        age = str(sheet.cell(row, 6).value or "").strip()
-        if not name or not district.startswith(main_district_value):
+
+def classify_attendance(roster, week_idx):
+    """
+    Classify one week from the roster matrix. Besides the name lists and counts,
+    returns the per-district member-ID arrays used for week-to-week diffing.
+    """
+    logger.debug(f"Classifying attendance for week column: {roster.week_cols[week_idx][0]}")
+    present = roster.matrix[:, week_idx].astype(bool)
+    attended_ids, not_attended_ids = roster.split_week(present, roster.known_in(week_idx))
+    attended = roster.names_of(attended_ids)
+    not_attended = roster.names_of(not_attended_ids)
+
+    district_counts, main_district_counts = roster.week_counts(present)
+    return attended, not_attended, district_counts, roster.main_district, main_district_counts, attended_ids, not_attended_ids
+
+def register_summary_styles(workbook):
+    """Register the named styles shared by every summary sheet header cell."""
+    for name, color in (('summary_header', '107C10'), ('summary_subheader', '5DBB63')):
+        if name in workbook.named_styles:
             continue
-        if main_district is None and main_district_value:
-            main_district = main_district_value
-            logger.debug(f"Set main district name to: {main_district}")
-        attendance = sheet.cell(row, week_col + 1).value
-        if attendance == 1:
-            if district not in attended:
-                attended[district] = []
-            attended[district].append(name)
-            if district not in district_counts:
-                district_counts[district] = {'total': 0, 'ages': {age: 0 for age in age_categories}}
-            if main_district_value not in main_district_counts:
-                main_district_counts[main_district_value] = {'total': 0, 'ages': {age: 0 for age in age_categories}}
-            district_counts[district]['total'] += 1
-            main_district_counts[main_district_value]['total'] += 1
-            effective_age = '青職以上' if age in youth_above or not age else age
-            if effective_age not in age_categories:
-                logger.warning(f"Unrecognized age '{age}' for {name} in {district}, defaulting to '青職以上'")
-                effective_age = '青職以上'
-            district_counts[district]['ages'][effective_age] += 1
-            main_district_counts[main_district_value]['ages'][effective_age] += 1
-        else:
-            if district not in not_attended:
-                not_attended[district] = []
-            not_attended[district].append(name)
-    total_attendance = sum(d['total'] for d in district_counts.values())
-    district_counts['總計'] = total_attendance
-    return attended, not_attended, district_counts, main_district, main_district_counts
+        style = NamedStyle(name=name)
+        style.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+        style.font = Font(color="FFFFFF", bold=True)
+        style.alignment = Alignment(horizontal='center')
+        workbook.add_named_style(style)
 
-def write_summary(new_sheet, attended, not_attended):
-    logger.debug(f"Writing summary with attended: {attended}, not_attended: {not_attended}")
+def summary_districts(attended, not_attended):
     districts = sorted(set(attended.keys()).union(not_attended.keys()), key=lambda x: chinese_to_int(x[3:4]))
+    max_len = max(max(len(attended.get(d, [])), len(not_attended.get(d, []))) for d in districts)
+    return districts, max_len
+
+def write_summary(new_sheet, attended, not_attended):
+    if logger.isEnabledFor(logging.DEBUG):
+        # 名單可能很長，只在 DEBUG 開啟時才格式化
+        logger.debug("Writing summary with attended: %s, not_attended: %s", attended, not_attended)
+    register_summary_styles(new_sheet.parent)
+    districts, max_len = summary_districts(attended, not_attended)
     row = 1
 
-    header_fill = PatternFill(start_color="107C10", end_color="107C10", fill_type="solid")
-    subheader_fill = PatternFill(start_color="5DBB63", end_color="5DBB63", fill_type="solid")
-    header_font = Font(color="FFFFFF", bold=True)
     for i, district in enumerate(districts):
         cell1 = new_sheet.cell(row, i * 2 + 1)
         cell2 = new_sheet.cell(row, i * 2 + 2)
         cell1.value = district
         cell2.value = district
-        cell1.fill = header_fill
-        cell2.fill = header_fill
-        cell1.font = header_font
-        cell2.font = header_font
-        cell1.alignment = Alignment(horizontal='center')
-        cell2.alignment = Alignment(horizontal='center')
+        cell1.style = 'summary_header'
+        cell2.style = 'summary_header'
 
         sub_cell1 = new_sheet.cell(row + 1, i * 2 + 1)
         sub_cell2 = new_sheet.cell(row + 1, i * 2 + 2)
         sub_cell1.value = "本週到會"
         sub_cell2.value = "未到會"
-        sub_cell1.fill = subheader_fill
-        sub_cell2.fill = subheader_fill
-        sub_cell1.font = header_font
-        sub_cell2.font = header_font
-        sub_cell1.alignment = Alignment(horizontal='center')
-        sub_cell2.alignment = Alignment(horizontal='center')
+        sub_cell1.style = 'summary_subheader'
+        sub_cell2.style = 'summary_subheader'
 
-    max_len = max(max(len(attended.get(d, [])), len(not_attended.get(d, []))) for d in districts)
     for r in range(max_len):
         for i, district in enumerate(districts):
             attended_list = attended.get(district, [])
@@ -142,52 +133,158 @@ def write_summary(new_sheet, attended, not_attended):
 
     logger.debug("Summary written successfully")
 
-def process_excel(file_stream, file_extension):
-    file_stream.seek(0)
-    file_content = file_stream.read()
-    buffered_stream = BytesIO(file_content)
-    logger.info(f"Processing file with extension: {file_extension}, Size: {len(file_content)} bytes")
+def _styled_cell(sheet, value, style):
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.style = style
+    return cell
 
-    if file_extension == '.xls':
-        logger.info("Detected .xls file, converting to .xlsx")
-        buffered_stream = convert_xls_to_xlsx(file_stream)
-        file_extension = '.xlsx'
+def write_summary_streaming(new_sheet, attended, not_attended):
+    """Same layout as write_summary, appended row by row to a write-only sheet."""
+    register_summary_styles(new_sheet.parent)
+    districts, max_len = summary_districts(attended, not_attended)
 
-    try:
-        workbook = openpyxl.load_workbook(buffered_stream)
-    except Exception as e:
-        logger.error(f"Failed to load workbook: {str(e)}")
-        raise
+    header_row = []
+    subheader_row = []
+    for district in districts:
+        header_row += [_styled_cell(new_sheet, district, 'summary_header') for _ in range(2)]
+        subheader_row += [_styled_cell(new_sheet, "本週到會", 'summary_subheader'),
+                          _styled_cell(new_sheet, "未到會", 'summary_subheader')]
+    new_sheet.append(header_row)
+    new_sheet.append(subheader_row)
 
-    input_sheet = workbook.active
-    logger.debug(f"Loaded sheet: {input_sheet.title}, Rows: {input_sheet.max_row}, Columns: {input_sheet.max_column}")
+    for r in range(max_len):
+        values = []
+        for district in districts:
+            attended_list = attended.get(district, [])
+            not_attended_list = not_attended.get(district, [])
+            values.append(attended_list[r] if r < len(attended_list) else None)
+            values.append(not_attended_list[r] if r < len(not_attended_list) else None)
+        new_sheet.append(values)
 
-    week_cols = []
-    current_month = "2025年1月"
-    for col in range(START_COLUMN, input_sheet.max_column + 1):
-        month_header = str(input_sheet.cell(1, col + 1).value or "")
-        week_header = str(input_sheet.cell(2, col + 1).value or "")
-        if "年" in month_header and "月" in month_header:
-            current_month = month_header.strip()
-        if "週" in week_header:
-            week_cols.append((col, week_header, current_month))
+def write_trend_sheet(new_sheet, roster, all_attendance_data):
+    """Per-member absence streaks, rolling attendance rates and returns; works on normal and write-only sheets."""
+    register_summary_styles(new_sheet.parent)
+    rows = trend_rows(roster, all_attendance_data)
+    new_sheet.append([_styled_cell(new_sheet, value, 'summary_header') for value in next(rows)])
+    for row in rows:
+        new_sheet.append(row)
 
-    logger.info(f"Detected week columns with months: {week_cols}")
+def write_streaming_workbook(output, input_workbook, summary_sheets, trend_sheet=None):
+    """
+    Write the output with a write-only workbook: the original sheets' values are
+    streamed from the (read-only) input workbook, followed by the summary sheets
+    and, given ``trend_sheet=(roster, all_attendance_data)``, the trend sheet.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    with timed('write_sheets'):
+        for input_sheet in input_workbook.worksheets:
+            original_sheet = workbook.create_sheet(input_sheet.title)
+            for row in input_sheet.iter_rows(values_only=True):
+                original_sheet.append(row)
+        for new_sheet_name, attended, not_attended in summary_sheets:
+            new_sheet = workbook.create_sheet(new_sheet_name)
+            logger.debug(f"Created new sheet: {new_sheet_name}")
+            write_summary_streaming(new_sheet, attended, not_attended)
+        if trend_sheet is not None:
+            write_trend_sheet(workbook.create_sheet(TREND_SHEET), *trend_sheet)
+    with timed('save_workbook'):
+        workbook.save(output)
 
-    if not week_cols:
-        logger.warning("No week columns detected; output will lack analytic sheets")
+def _no_progress(stage, done=None, total=None):
+    pass
+
+def week_date(month_prefix, week_name):
+    """Nominal date of a week column (used to order weeks) and its summary sheet name."""
+    # 提取年份並生成唯一的工作表名稱
+    year = int(month_prefix.split("年")[0])
+    month_part = month_prefix.split("年")[1]
+    week_str = week_name.replace("第", "").replace("週", "")
+    week_num = chinese_to_int(week_str)
+    month_num = int(month_part.replace("月", ""))
+    current_date = datetime(year, month_num, min(week_num * 7, 28))
+    return current_date, f"{year}年{month_part}{week_name} 主日"
+
+def open_input_workbook(path, file_extension, streaming, progress=None, styled=False):
+    """
+    Open an uploaded .xls/.xlsx straight from its path on disk: openpyxl reads
+    the zip members from the file and xlrd memory-maps it, so the upload is
+    never buffered whole. Returns (workbook, source) where ``source`` records
+    the path, its extension and the streaming mode, so write_upload_output can
+    reopen the same input. .xls files read by the native reader are always
+    opened in streaming mode; the others are converted by soffice into a
+    temporary .xlsx that is removed as soon as it is loaded.
+
+    The workbook is opened read-only, which is all the analysis needs; only
+    ``styled=True`` (writing a non-streaming output) loads it in full with
+    its formatting. ``streaming`` only selects how the output is written.
+    """
+    if progress is None:
+        progress = _no_progress
+    logger.info(f"Processing file with extension: {file_extension}, Size: {os.path.getsize(path)} bytes")
+
+    workbook = None
+    load_path = path
+    convert_dir = None
+    if file_extension == '.xls':
+        progress('convert')
+        with timed('load'):
+            workbook = open_xls_workbook(path)
+        if workbook is not None:
+            logger.info("Detected .xls file, parsed with the native reader")
+            streaming = True
+        else:
+            logger.info("Detected .xls file, converting to .xlsx")
+            convert_dir = tempfile.mkdtemp(prefix='convert-')
 
+    try:
+        if convert_dir is not None:
+            with timed('convert'):
+                load_path = convert_xls_to_xlsx(path, convert_dir)
+        progress('parse')
+        if workbook is None:
+            try:
+                with timed('load'):
+                    workbook = openpyxl.load_workbook(load_path, read_only=not styled)
+            except Exception as e:
+                logger.error(f"Failed to load workbook: {str(e)}")
+                raise
+    finally:
+        if convert_dir is not None:
+            # 唯讀模式的 workbook 已開啟轉檔結果，刪除目錄後仍可讀取（POSIX）
+            shutil.rmtree(convert_dir, ignore_errors=True)
+    source = {
+        'kind': 'upload',
+        'path': path,
+        'extension': file_extension,
+        'streaming': streaming,
+    }
+    return workbook, source
+
+def analyse_roster(roster, sheet_names, progress=None):
+    """
+    Classify every week of ``roster``. Weeks without attendees are skipped.
+    ``sheet_names`` holds the names already taken in the output workbook and
+    is extended with each summary sheet's name.
+
+    Returns a dict with 'all_attendance_data', 'summary_sheets'
+    ([(sheet_name, attended, not_attended)]) and the latest week's fields.
+    """
+    if progress is None:
+        progress = _no_progress
+    week_cols = roster.week_cols
     all_attendance_data = []
+    summary_sheets = []
     latest_date = None
-    latest_attended = None
-    latest_not_attended = None
+    latest_attendance_data = None
     latest_week = None
     latest_districts = None
     latest_main_district = None
     latest_main_district_counts = None
-    for col, week_name, month_prefix in week_cols:
+    for week_idx, (col, week_name, month_prefix) in enumerate(week_cols):
+        progress('classify', week_idx, len(week_cols))
         logger.info(f"Processing week: {week_name} in {month_prefix}")
-        attended, not_attended, district_counts, main_district, main_district_counts = classify_attendance(input_sheet, col)
+        (attended, not_attended, district_counts, main_district, main_district_counts,
+         attended_ids, not_attended_ids) = classify_attendance(roster, week_idx)
         if main_district and not latest_main_district:
             latest_main_district = main_district
 
@@ -195,58 +292,152 @@ def process_excel(file_stream, file_extension):
             logger.info(f"No attendees for {week_name} in {month_prefix}, skipping sheet creation and data inclusion")
             continue  # 跳過無人出席的週，不加入 all_attendance_data
 
-        # 提取年份並生成唯一的工作表名稱
-        year = int(month_prefix.split("年")[0])
-        month_part = month_prefix.split("年")[1]
-        week_str = week_name.replace("第", "").replace("週", "")
-        week_num = chinese_to_int(week_str)
-        month_num = int(month_part.replace("月", ""))
-        current_date = datetime(year, month_num, min(week_num * 7, 28))
-        new_sheet_name = f"{year}年{month_part}{week_name} 主日"
+        current_date, new_sheet_name = week_date(month_prefix, week_name)
 
-        all_attendance_data.append((current_date, {'attended': attended, 'not_attended': not_attended}, f"{month_prefix}{week_name}"))
+        attendance_data = {
+            'attended': attended,
+            'not_attended': not_attended,
+            'attended_ids': attended_ids,
+            'not_attended_ids': not_attended_ids,
+        }
+        all_attendance_data.append((current_date, attendance_data, f"{month_prefix}{week_name}"))
 
         if latest_date is None or current_date > latest_date:
             latest_date = current_date
-            latest_attended = attended
-            latest_not_attended = not_attended
+            latest_attendance_data = attendance_data
             latest_week = f"{month_prefix}{week_name}"
             latest_districts = district_counts
             latest_main_district_counts = main_district_counts
 
-        if new_sheet_name in workbook.sheetnames:
+        if new_sheet_name in sheet_names:
             logger.error(f"Duplicate sheet name detected: {new_sheet_name}")
             raise ValueError(f"Sheet name '{new_sheet_name}' already exists")
+        sheet_names.add(new_sheet_name)
+        summary_sheets.append((new_sheet_name, attended, not_attended))
 
-        new_sheet = workbook.create_sheet(new_sheet_name)
-        logger.debug(f"Created new sheet: {new_sheet_name}")
-        write_summary(new_sheet, attended, not_attended)
-
-    if not all_attendance_data:
-        logger.warning("No weeks with attendees found in the file")
-        return {
-            'output_stream': BytesIO(),  # 返回空的輸出流
-            'latest_analytic_date': None,
-            'latest_attendance_data': None,
-            'latest_week_display': None,
-            'latest_district_counts': None,
-            'latest_main_district': None,
-            'latest_main_district_counts': None,
-            'all_attendance_data': []
-        }
+    return {
+        'all_attendance_data': all_attendance_data,
+        'summary_sheets': summary_sheets,
+        'latest_date': latest_date,
+        'latest_attendance_data': latest_attendance_data,
+        'latest_week': latest_week,
+        'latest_districts': latest_districts,
+        'latest_main_district': latest_main_district,
+        'latest_main_district_counts': latest_main_district_counts,
+    }
 
-    output_stream = BytesIO()
-    workbook.save(output_stream)
-    output_stream.seek(0)
-    logger.info("File processing completed successfully")
+def empty_result(roster):
+    return {
+        'output_source': None,
+        'latest_analytic_date': None,
+        'latest_attendance_data': None,
+        'latest_week_display': None,
+        'latest_district_counts': None,
+        'latest_main_district': None,
+        'latest_main_district_counts': None,
+        'all_attendance_data': [],
+        'roster': roster
+    }
 
+def build_result(analysis, output_source, roster):
+    """
+    The process_excel result dict for an analyse_roster() output. The output
+    workbook is not written yet: ``output_source`` is what write_output needs
+    to build it on the first download.
+    """
+    latest_date = analysis['latest_date']
     return {
-        'output_stream': output_stream,
+        'output_source': output_source,
         'latest_analytic_date': latest_date.strftime("%Y年%m月%d日") if latest_date else None,
-        'latest_attendance_data': {'attended': latest_attended, 'not_attended': latest_not_attended} if latest_attended else None,
-        'latest_week_display': latest_week,
-        'latest_district_counts': latest_districts,
-        'latest_main_district': latest_main_district,
-        'latest_main_district_counts': latest_main_district_counts,
-        'all_attendance_data': all_attendance_data
+        'latest_attendance_data': analysis['latest_attendance_data'],
+        'latest_week_display': analysis['latest_week'],
+        'latest_district_counts': analysis['latest_districts'],
+        'latest_main_district': analysis['latest_main_district'],
+        'latest_main_district_counts': analysis['latest_main_district_counts'],
+        'all_attendance_data': analysis['all_attendance_data'],
+        'roster': roster
     }
+
+def process_excel(upload_path, file_extension, streaming=None, progress=None):
+    """
+    Analyse an uploaded roster spooled to ``upload_path``, opened read-only.
+    With ``streaming`` (default: STREAMING_WORKBOOK) the output will be
+    written with a write-only workbook, trading the original sheet's
+    formatting for a much lower peak memory.
+
+    .xls files are parsed in-process when possible (always written in streaming
+    mode); soffice conversion is only used for files the native reader rejects.
+
+    The output workbook is deferred to the first download (see write_output);
+    the result's ``output_source`` points at ``upload_path``, so the upload
+    must stay in place until the result is saved.
+    The analysed weeks are also added to the attendance history (history_store).
+
+    ``progress(stage, done=None, total=None)`` is called as processing enters
+    each stage: 'convert' (.xls only), 'parse' and 'classify' (once per week).
+    """
+    if streaming is None:
+        streaming = STREAMING_WORKBOOK
+    if progress is None:
+        progress = _no_progress
+    started = time.perf_counter()
+    workbook, source = open_input_workbook(upload_path, file_extension, streaming, progress)
+
+    input_sheet = workbook.active
+    logger.debug(f"Loaded sheet: {input_sheet.title}, Rows: {input_sheet.max_row}, Columns: {input_sheet.max_column}")
+
+    with timed('roster'):
+        roster = read_roster(input_sheet)
+
+    if not roster.week_cols:
+        logger.warning("No week columns detected; output will lack analytic sheets")
+
+    if TREND_SHEET in workbook.sheetnames:
+        logger.error(f"Duplicate sheet name detected: {TREND_SHEET}")
+        raise ValueError(f"Sheet name '{TREND_SHEET}' already exists")
+    with timed('classify'):
+        analysis = analyse_roster(roster, set(workbook.sheetnames) | {TREND_SHEET}, progress)
+
+    workbook.close()
+    if not analysis['all_attendance_data']:
+        logger.warning("No weeks with attendees found in the file")
+        return empty_result(roster)
+
+    record_history(roster, analysis['all_attendance_data'])
+    logger.info(f"File processing completed successfully in {time.perf_counter() - started:.2f}s "
+                f"(streaming={source['streaming']}, peak RSS {peak_rss_kb()} KB)")
+
+    return build_result(analysis, source, roster)
+
+def summary_sheets_of(roster, all_attendance_data):
+    """(sheet_name, attended, not_attended) for every analysed week, in the roster's column order."""
+    by_label = {week_name: attendance_data for _, attendance_data, week_name in all_attendance_data}
+    summary_sheets = []
+    for _, week_name, month_prefix in roster.week_cols:
+        attendance_data = by_label.get(f"{month_prefix}{week_name}")
+        if attendance_data is not None:
+            summary_sheets.append((week_date(month_prefix, week_name)[1],
+                                   attendance_data['attended'], attendance_data['not_attended']))
+    return summary_sheets
+
+def write_upload_output(output, source, roster, all_attendance_data):
+    """
+    Write the output workbook of a single upload to ``output`` (a path or
+    stream): the reopened input's sheets, one summary sheet per week and the
+    trend sheet.
+    """
+    workbook, _ = open_input_workbook(source['path'], source['extension'], source['streaming'],
+                                      styled=not source['streaming'])
+    summary_sheets = summary_sheets_of(roster, all_attendance_data)
+    if source['streaming']:
+        write_streaming_workbook(output, workbook, summary_sheets, (roster, all_attendance_data))
+        workbook.close()
+        return
+    with timed('write_sheets'):
+        for new_sheet_name, attended, not_attended in summary_sheets:
+            new_sheet = workbook.create_sheet(new_sheet_name)
+            logger.debug(f"Created new sheet: {new_sheet_name}")
+            write_summary(new_sheet, attended, not_attended)
+        write_trend_sheet(workbook.create_sheet(TREND_SHEET), roster, all_attendance_data)
+    with timed('save_workbook'):
+        workbook.save(output)
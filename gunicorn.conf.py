@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# 在 master 載入應用程式（openpyxl、模板）後再 fork 出 worker
+preload_app = True
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+
+# 每個 worker 各自持有 LibreOffice 轉檔池（SOFFICE_POOL_SIZE）與處理行程池（JOB_WORKERS），
+# 兩者皆依 worker 數倍增；只有 JOB_QUEUE_SIZE 為全站共用的上限
+
+# 處理大型活頁簿後記憶體不易歸還，處理一定數量的請求後重啟 worker；
+# 重啟會丟棄該 worker 的轉檔池與排隊中的工作（/jobs 輪詢也計入請求數），故不宜設得太小
+max_requests = int(os.getenv('MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('MAX_REQUESTS_JITTER', '100'))
+
+# 同步上傳（含 soffice 轉檔）可能需要數十秒
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
@@ -0,0 +1,279 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+from config import logger, HISTORY_DB
+from metrics import timed
+from trends import known_matrix, week_matrix
+from utils import chinese_to_int
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    member_id INTEGER PRIMARY KEY,
+    district TEXT NOT NULL,
+    name TEXT NOT NULL,
+    main_district TEXT NOT NULL,
+    age TEXT NOT NULL,
+    UNIQUE (district, name)
+);
+CREATE TABLE IF NOT EXISTS weeks (
+    week_id INTEGER PRIMARY KEY,
+    label TEXT NOT NULL,
+    week_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS weeks_date ON weeks (week_date);
+CREATE TABLE IF NOT EXISTS attendance (
+    member_id INTEGER NOT NULL,
+    week_id INTEGER NOT NULL,
+    attended INTEGER NOT NULL,
+    PRIMARY KEY (member_id, week_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS week_counts (
+    district TEXT NOT NULL,
+    week_id INTEGER NOT NULL,
+    attended INTEGER NOT NULL,
+    members INTEGER NOT NULL,
+    PRIMARY KEY (district, week_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS week_counts_week ON week_counts (week_id);
+"""
+
+
+def week_id(label):
+    """
+    Chronological key of a week label such as "2024年1月第五週": yyyy·mm·n as
+    one integer. Unlike the nominal week date it tells the fourth and fifth
+    weeks of a month apart.
+    """
+    month_prefix, week_name = label.split('月', 1)
+    year, month = month_prefix.split('年')
+    return int(year) * 1000 + int(month) * 10 + chinese_to_int(week_name.replace('第', '').replace('週', ''))
+
+
+def previous_week_ids(label):
+    """
+    The week_ids that can immediately precede ``label``: the week before in
+    the same month, or else the fifth then the fourth week of the month before.
+    """
+    current = week_id(label)
+    year, month, week = current // 1000, current // 10 % 100, current % 10
+    if week > 1:
+        return [current - 1]
+    year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return [year * 1000 + month * 10 + 5, year * 1000 + month * 10 + 4]
+
+
+class HistoryStore:
+    """
+    Attendance accumulated across uploads in a local SQLite file.
+
+    Members are identified by (district, name): someone who moves district
+    starts a new history. Every analysed week of an upload is upserted per
+    (member, week), so re-uploading overlapping rosters only corrects the
+    stored weeks. Per-district weekly totals are kept in ``week_counts``,
+    keyed by district and week, so range queries never scan member rows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        # 每個執行緒（及 fork 後的行程）使用各自的連線
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def record(self, roster, all_attendance_data):
+        """
+        Upsert the members of ``roster`` and their attendance in every analysed
+        week, leaving out the weeks a member's file did not record.
+        """
+        weeks = sorted(all_attendance_data, key=lambda x: x[0])
+        if not weeks or not len(roster):
+            return
+        week_rows = [(week_id(label), label, date.date().isoformat()) for date, _, label in weeks]
+        week_ids = [week for week, _, _ in week_rows]
+        matrix = week_matrix(roster, [label for _, _, label in weeks])
+        known = known_matrix(roster, [label for _, _, label in weeks])
+        districts = list(roster.district_ids)
+        placeholders = ','.join('?' * len(districts))
+        names = [str(name) for name in roster.names]
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO members (district, name, main_district, age) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (district, name) DO UPDATE SET main_district = excluded.main_district, age = excluded.age",
+                    zip(roster.districts, names, roster.main_districts, roster.ages)
+                )
+                member_ids = self._member_ids(conn, districts, placeholders)
+                ids = np.array([member_ids[key] for key in zip(roster.districts, names)], dtype=np.int64)
+                conn.executemany(
+                    "INSERT INTO weeks (week_id, label, week_date) VALUES (?, ?, ?) "
+                    "ON CONFLICT (week_id) DO UPDATE SET label = excluded.label, week_date = excluded.week_date",
+                    week_rows
+                )
+                # 依主鍵順序寫入；出席狀態未變的列不重寫
+                order = np.argsort(ids, kind='stable')
+                member_col = np.repeat(ids[order], len(week_ids))
+                week_col = np.tile(np.array(week_ids, dtype=np.int64), len(ids))
+                attended_col = matrix[order].ravel().view(np.uint8)
+                if known is not None:
+                    recorded = known[order].ravel()
+                    member_col, week_col, attended_col = member_col[recorded], week_col[recorded], attended_col[recorded]
+                conn.executemany(
+                    "INSERT INTO attendance (member_id, week_id, attended) VALUES (?, ?, ?) "
+                    "ON CONFLICT (member_id, week_id) DO UPDATE SET attended = excluded.attended "
+                    "WHERE attended != excluded.attended",
+                    zip(member_col.tolist(), week_col.tolist(), attended_col.tolist())
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO week_counts (district, week_id, attended, members) "
+                    "SELECT m.district, a.week_id, SUM(a.attended), COUNT(*) FROM members m "
+                    "JOIN attendance a ON a.member_id = m.member_id AND a.week_id BETWEEN ? AND ? "
+                    f"WHERE m.district IN ({placeholders}) GROUP BY m.district, a.week_id",
+                    [week_ids[0], week_ids[-1]] + districts
+                )
+        except sqlite3.Error as e:
+            # 歷史紀錄失敗不影響本次分析
+            logger.warning(f"Could not record attendance history: {str(e)}")
+            return
+        logger.info(f"Recorded {len(ids)} members x {len(week_ids)} weeks into the attendance history")
+
+    @staticmethod
+    def _member_ids(conn, districts, placeholders):
+        rows = conn.execute(
+            f"SELECT district, name, member_id FROM members WHERE district IN ({placeholders})", districts
+        )
+        return {(district, name): member_id for district, name, member_id in rows}
+
+    def previous_week(self, roster, label):
+        """
+        The stored week immediately before ``label`` for the roster's
+        districts, as (date, attendance_data, label) with per-district
+        member-ID arrays in ``roster``'s IDs. Members the store does not know
+        are left out of both sides. Returns None when that week was never
+        stored, or none of the roster's members were recorded in it.
+        """
+        districts = list(roster.district_ids)
+        placeholders = ','.join('?' * len(districts))
+        candidates = previous_week_ids(label)
+        try:
+            conn = self._connect()
+            # 只比較緊接的前一週；較早的週次可能相隔數月或來自其他名冊
+            row = conn.execute(
+                f"SELECT w.week_id, w.label, w.week_date FROM weeks w WHERE w.week_id = ("
+                f"SELECT MAX(week_id) FROM week_counts WHERE district IN ({placeholders}) "
+                f"AND week_id IN ({','.join('?' * len(candidates))}))",
+                districts + candidates
+            ).fetchone()
+            if row is None:
+                return None
+            previous_id, previous_label, week_date = row
+            rows = conn.execute(
+                "SELECT m.district, m.name, a.attended FROM members m "
+                "JOIN attendance a ON a.member_id = m.member_id AND a.week_id = ? "
+                f"WHERE m.district IN ({placeholders})",
+                [previous_id] + districts
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read attendance history: {str(e)}")
+            return None
+
+        member_of = {(district, str(name)): member for member, (district, name) in enumerate(zip(roster.districts, roster.names))}
+        known = np.zeros(len(roster), dtype=bool)
+        present = np.zeros(len(roster), dtype=bool)
+        for district, name, attended in rows:
+            member = member_of.get((district, name))
+            if member is not None:
+                known[member] = True
+                present[member] = bool(attended)
+        if not known.any():
+            return None
+        attended_ids = {}
+        not_attended_ids = {}
+        for district, ids in roster.district_ids.items():
+            ids = ids[known[ids]]
+            mask = present[ids]
+            if mask.any():
+                attended_ids[district] = ids[mask]
+            if not mask.all():
+                not_attended_ids[district] = ids[~mask]
+        attendance_data = {
+            'attended': roster.names_of(attended_ids),
+            'not_attended': roster.names_of(not_attended_ids),
+            'attended_ids': attended_ids,
+            'not_attended_ids': not_attended_ids,
+        }
+        return datetime.fromisoformat(week_date), attendance_data, previous_label
+
+    def district_weeks(self, district=None, start=None, end=None):
+        """
+        Weekly (label, date, district, attended, members) rows between the
+        ``start`` and ``end`` dates (either may be None), optionally for one district.
+        """
+        query = ("SELECT w.label, w.week_date, c.district, c.attended, c.members "
+                 "FROM weeks w JOIN week_counts c ON c.week_id = w.week_id WHERE w.week_date BETWEEN ? AND ?")
+        params = [start.date().isoformat() if start else '0000-01-01', end.date().isoformat() if end else '9999-12-31']
+        if district is not None:
+            query += " AND c.district = ?"
+            params.append(district)
+        query += " ORDER BY w.week_id, c.district"
+        try:
+            return self._connect().execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read attendance history: {str(e)}")
+            return []
+
+
+_store = None
+
+
+def get_history_store():
+    """Return the process-wide history store, or None when HISTORY_DB is empty."""
+    global _store
+    if not HISTORY_DB:
+        return None
+    if _store is None:
+        _store = HistoryStore(HISTORY_DB)
+    return _store
+
+
+_record_executor = None
+_record_pid = None
+
+
+def _get_record_executor():
+    # 寫入集中於單一執行緒，依上傳順序進行；fork 出的工作行程另建自己的執行緒
+    global _record_executor, _record_pid
+    if _record_executor is None or _record_pid != os.getpid():
+        _record_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history')
+        _record_pid = os.getpid()
+    return _record_executor
+
+
+def _record(roster, all_attendance_data):
+    try:
+        with timed('history'):
+            get_history_store().record(roster, all_attendance_data)
+    except Exception as e:
+        logger.error(f"Recording attendance history failed: {str(e)}")
+
+
+def record_history(roster, all_attendance_data):
+    """
+    Add an analysed upload to the history store, when one is configured, on a
+    background thread: the upload's own weeks never affect its comparisons,
+    which only look at earlier weeks.
+    """
+    if get_history_store() is not None:
+        _get_record_executor().submit(_record, roster, all_attendance_data)
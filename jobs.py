@@ -0,0 +1,198 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from concurrent.futures.process import BrokenProcessPool
+from config import logger, JOB_DIR, JOB_WORKERS, JOB_QUEUE_SIZE, JOB_STALE_AFTER, PRERENDER_WEEKS, RESULT_STORE_TTL
+from excel_handler import process_excel
+from metrics import flush as flush_metrics
+from result_cache import get_result_cache
+from result_store import get_result_store
+from utils import is_process_alive, link_or_copy
+from week_tables import render_all_weeks
+
+try:
+    import fcntl
+except ImportError:
+    # 非 POSIX 平台：計算排隊數與建立工作之間不加鎖
+    fcntl = None
+
+NO_ATTENDANCE_ERROR = "上傳的文件中無任何出席紀錄，請檢查數據後重新上傳。"
+STALE_ERROR = "處理中斷（伺服器工作行程已重啟），請重新上傳。"
+STATUS_FILE = 'status.json'
+# classify 階段每週都會回報進度；狀態檔最多每隔此秒數寫一次
+PROGRESS_INTERVAL = 0.5
+
+
+class QueueFullError(Exception):
+    """Raised when JOB_QUEUE_SIZE uploads, across all workers, are already queued or running."""
+
+
+def _job_path(job_id, name=''):
+    return os.path.join(JOB_DIR, job_id, name)
+
+
+def _write_status(job_id, **status):
+    status['job_id'] = job_id
+    status['updated'] = time.time()
+    path = _job_path(job_id, STATUS_FILE)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return status
+
+
+def _is_stale(status):
+    # owner：持有該工作行程池的 web worker；它結束後排隊中的工作即遺失
+    owner = status.get('owner')
+    if owner is not None and not is_process_alive(owner):
+        return True
+    return time.time() - status.get('updated', 0) > JOB_STALE_AFTER
+
+
+def read_status(job_id):
+    """
+    Current status dict of a job, or None for unknown IDs. A queued or
+    running job whose web worker has exited, or whose status has not changed
+    for JOB_STALE_AFTER seconds, is lost: it is recorded and reported as failed.
+    """
+    if not (isinstance(job_id, str) and len(job_id) == 32 and job_id.isalnum()):
+        return None
+    try:
+        with open(_job_path(job_id, STATUS_FILE), encoding='utf-8') as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if status.get('state') in ('queued', 'running') and _is_stale(status):
+        logger.warning(f"Job {job_id} was lost in state {status['state']}; marking it failed")
+        try:
+            status = _write_status(job_id, state='failed', stage=status.get('stage'), error=STALE_ERROR)
+        except OSError:
+            status.update(state='failed', error=STALE_ERROR)
+    return status
+
+
+def run_job(job_id, upload_path, file_extension, cache_key):
+    """Process one spooled upload in a pool worker, recording progress in the job's status file."""
+    last_write = [0.0, None]
+    # 工作行程由提交該工作的 web worker fork 出
+    owner = os.getppid()
+
+    def progress(stage, done=None, total=None):
+        now = time.monotonic()
+        if stage == last_write[1] and now - last_write[0] < PROGRESS_INTERVAL:
+            return
+        last_write[:] = [now, stage]
+        _write_status(job_id, state='running', stage=stage, done=done, total=total, owner=owner)
+
+    try:
+        result = process_excel(upload_path, file_extension, progress=progress)
+        if not result['all_attendance_data']:
+            _write_status(job_id, state='failed', stage='classify', error=NO_ATTENDANCE_ERROR)
+            return
+        cache = get_result_cache()
+        if cache is not None and cache_key is not None:
+            cache.put(cache_key, result)
+        progress('save')
+        result_id = get_result_store().save(result)
+        _write_status(job_id, state='done', stage='save', result_id=result_id)
+        if PRERENDER_WEEKS:
+            render_all_weeks(result_id)
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {str(e)}")
+        _write_status(job_id, state='failed', error=f"Processing failed: {str(e)}")
+    finally:
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+        flush_metrics()
+
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+    return _executor
+
+
+def _job_finished(job_id, future):
+    global _executor
+    error = future.exception()
+    if error is not None:
+        # run_job 自行處理例外；這裡只會遇到 worker 行程異常結束
+        logger.error(f"Job {job_id} worker crashed: {str(error)}")
+        _write_status(job_id, state='failed', error=f"Processing failed: {str(error)}")
+        if isinstance(error, BrokenProcessPool):
+            with _lock:
+                _executor = None
+
+
+def _expire_jobs():
+    now = time.time()
+    for entry in os.listdir(JOB_DIR):
+        path = os.path.join(JOB_DIR, entry)
+        try:
+            if now - os.path.getmtime(path) > RESULT_STORE_TTL:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+
+
+@contextmanager
+def _admission_lock():
+    # 各 gunicorn worker 共用 JOB_DIR：計數與建立工作須在同一把鎖內完成
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(JOB_DIR, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _active_jobs():
+    """Jobs of any worker that are queued or running; lost ones are marked failed on the way."""
+    active = 0
+    for entry in os.listdir(JOB_DIR):
+        status = read_status(entry)
+        if status is not None and status['state'] in ('queued', 'running'):
+            active += 1
+    return active
+
+
+def submit_job(spooled_path, file_extension, cache_key=None):
+    """
+    Link a spooled upload into a new job directory and queue it on this
+    worker's process pool. Returns the job ID; raises QueueFullError when
+    JOB_QUEUE_SIZE jobs are already queued or running in the job directory,
+    which every worker shares.
+    """
+    os.makedirs(JOB_DIR, exist_ok=True)
+    with _admission_lock():
+        _expire_jobs()
+        active = _active_jobs()
+        if active >= JOB_QUEUE_SIZE:
+            raise QueueFullError(f"{active} uploads already queued")
+        job_id = uuid.uuid4().hex
+        os.makedirs(_job_path(job_id))
+        upload_path = _job_path(job_id, f'upload{file_extension}')
+        link_or_copy(spooled_path, upload_path)
+        _write_status(job_id, state='queued', stage='queued', owner=os.getpid())
+
+    try:
+        with _lock:
+            executor = _get_executor()
+        future = executor.submit(run_job, job_id, upload_path, file_extension, cache_key)
+    except Exception as e:
+        _write_status(job_id, state='failed', error=f"Processing failed: {str(e)}")
+        raise
+    future.add_done_callback(lambda f: _job_finished(job_id, f))
+    logger.info(f"Queued job {job_id} ({active + 1} queued or running)")
+    return job_id
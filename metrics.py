@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from config import logger, METRICS_DIR
+from utils import is_process_alive
+
+try:
+    import fcntl
+except ImportError:
+    # 非 POSIX 平台：不合併已結束行程的統計檔
+    fcntl = None
+
+# 直方圖的分界（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram with one label, rendered in the text exposition format."""
+
+    def __init__(self, name, help_text, label, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [bucket counts..., count, sum]
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _own_series(self):
+        # fork 出的子行程（gunicorn worker、工作行程池）從零開始累計
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._series = {}
+        return self._series
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._own_series().setdefault(label_value, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(values) for key, values in self._own_series().items()}
+
+    def render(self, series):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, values in sorted(series.items()):
+            label = f'{self.label}="{label_value}"'
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values[-2]}')
+            lines.append(f'{self.name}_count{{{label}}} {values[-2]}')
+            lines.append(f'{self.name}_sum{{{label}}} {values[-1]:.6f}')
+        return lines
+
+
+class Counter(Histogram):
+    """Prometheus counter with one label, kept per process like Histogram."""
+
+    def __init__(self, name, help_text, label):
+        super().__init__(name, help_text, label, buckets=())
+
+    def inc(self, label_value, amount=1):
+        with self._lock:
+            series = self._own_series().setdefault(label_value, [0])
+            series[0] += amount
+
+    def render(self, series):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_value, values in sorted(series.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {values[0]}')
+        return lines
+
+
+stage_duration = Histogram('attend_stage_duration_seconds', 'Time spent in each processing stage.', 'stage')
+request_duration = Histogram('attend_request_duration_seconds', 'Time to produce a response, per endpoint.', 'endpoint')
+cache_requests = Counter('attend_result_cache_requests_total', 'Result cache lookups by outcome (hit or miss).', 'result')
+METRICS = (stage_duration, request_duration, cache_requests)
+
+# 已結束行程的統計合併至此檔
+EXITED_FILE = 'exited.json'
+_process_pid = None
+_process_file = None
+
+# 目前請求已記錄的各階段耗時，供 Server-Timing 標頭使用
+_request = threading.local()
+
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block into the stage histogram and the current request's timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe(stage, elapsed)
+        timings = getattr(_request, 'timings', None)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def start_request():
+    _request.timings = {}
+    _request.started = time.perf_counter()
+
+
+def finish_request(endpoint):
+    """
+    Record the request's duration and return its Server-Timing header value
+    (stages in the order they first ran, then the total), or None outside a timed request.
+    """
+    timings = getattr(_request, 'timings', None)
+    if timings is None:
+        return None
+    total = time.perf_counter() - _request.started
+    request_duration.observe(endpoint or 'unknown', total)
+    _request.timings = None
+    flush()
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(entries)
+
+
+def _own_file():
+    # 以 pid 加啟動時間命名：pid 被重用時不會覆蓋舊行程的統計
+    global _process_pid, _process_file
+    if _process_pid != os.getpid():
+        _process_pid = os.getpid()
+        _process_file = f'{_process_pid}-{time.time_ns()}.json'
+    return _process_file
+
+
+def flush():
+    """
+    Write this process's metrics to METRICS_DIR so /metrics, served by
+    any one worker, can add up every process (including exited ones).
+    """
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, _own_file())
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump({metric.name: metric.snapshot() for metric in METRICS}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write metrics to {path}: {str(e)}")
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(totals, snapshot):
+    for name, series in snapshot.items():
+        merged = totals.setdefault(name, {})
+        for label_value, values in series.items():
+            current = merged.setdefault(label_value, [0] * len(values))
+            merged[label_value] = [a + b for a, b in zip(current, values)]
+
+
+def _pid_of(filename):
+    # "<pid>-<啟動時間>.json"；舊版為 "<pid>.json"
+    pid = filename[:-len('.json')].split('-')[0]
+    return int(pid) if pid.isdigit() else None
+
+
+def _fold_exited():
+    """
+    Add the files of exited processes (recycled workers, pool children) to
+    EXITED_FILE and remove them, so METRICS_DIR holds one file per live
+    process plus the aggregate.
+    """
+    if fcntl is None:
+        return
+    try:
+        with open(os.path.join(METRICS_DIR, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited = [
+                filename for filename in os.listdir(METRICS_DIR)
+                if filename.endswith('.json') and _pid_of(filename) is not None
+                and not is_process_alive(_pid_of(filename))
+            ]
+            if not exited:
+                return
+            exited_path = os.path.join(METRICS_DIR, EXITED_FILE)
+            totals = _read(exited_path) or {}
+            for filename in exited:
+                snapshot = _read(os.path.join(METRICS_DIR, filename))
+                if snapshot:
+                    _merge(totals, snapshot)
+            tmp_path = f'{exited_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(totals, f)
+            os.replace(tmp_path, exited_path)
+            for filename in exited:
+                os.remove(os.path.join(METRICS_DIR, filename))
+    except OSError as e:
+        logger.warning(f"Could not fold metrics of exited processes: {str(e)}")
+
+
+def _collect():
+    if not METRICS_DIR:
+        return {metric.name: metric.snapshot() for metric in METRICS}
+    flush()
+    _fold_exited()
+    totals = {metric.name: {} for metric in METRICS}
+    for filename in os.listdir(METRICS_DIR):
+        if filename.endswith('.json'):
+            snapshot = _read(os.path.join(METRICS_DIR, filename))
+            if snapshot:
+                _merge(totals, snapshot)
+    return totals
+
+
+def render_metrics():
+    """All processes' metrics in the Prometheus text format."""
+    totals = _collect()
+    lines = []
+    for metric in METRICS:
+        lines += metric.render(totals.get(metric.name, {}))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,48 @@
+import threading
+from batch import write_combined_workbook
+from config import logger
+from excel_handler import write_upload_output
+from result_store import get_result_store
+
+# 同一行程內避免同時產生同一份輸出檔
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def write_output(output, source, roster, all_attendance_data):
+    """Write the output workbook described by a result's ``output_source`` to ``output``."""
+    if source['kind'] == 'batch':
+        write_combined_workbook(output, roster, source['sources'], all_attendance_data)
+    else:
+        write_upload_output(output, source, roster, all_attendance_data)
+
+
+def get_output_path(result_id):
+    """
+    Path of a result's output workbook, generating it on the first call and
+    keeping it next to the result for later downloads. Returns None when the
+    result does not exist.
+    """
+    store = get_result_store()
+    path = store.output_path(result_id)
+    if path is not None or not store.has_output(result_id):
+        return path
+
+    with _locks_lock:
+        lock = _locks.setdefault(result_id, threading.Lock())
+    with lock:
+        path = store.output_path(result_id)
+        if path is None:
+            source = store.load_source(result_id)
+            roster = store.load_roster(result_id)
+            meta = store.load_meta(result_id)
+            if source is None or roster is None or meta is None:
+                return None
+            all_attendance_data = [store.load_week(result_id, idx) for idx in range(len(meta['weeks']))]
+            logger.info(f"Generating output workbook for result {result_id}")
+            path = store.save_output(
+                result_id, lambda output: write_output(output, source, roster, all_attendance_data)
+            )
+    with _locks_lock:
+        _locks.pop(result_id, None)
+    return path
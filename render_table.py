@@ -1,18 +1,10 @@
-from config import logger
+import numpy as np
+from config import logger, AGE_CATEGORIES
 from utils import chinese_to_int, parse_district
 
-def render_attendance_table(week_display, latest_attendance_data, all_attendance_data, latest_district_counts, latest_main_district_counts):
-    # 獲取所有區域名稱
-    all_districts = set(latest_attendance_data['attended'].keys()).union(latest_attendance_data['not_attended'].keys())
-    
-    # 只保留具體子區（排除僅有大區的鍵）
-    districts = sorted(
-        [d for d in all_districts if len(parse_district(d)) > 1 and parse_district(d)[1]],  # 確保有子區資訊且子區非空
-        key=parse_district
-    )
-    
-    if not districts:
-        return """
+EMPTY_IDS = np.empty(0, dtype=np.int32)
+
+NO_DATA_HTML = """
         <div class="district-section">
             <table class="excel-table">
                 <tr class="title-row"><th>該週無有效數據</th></tr>
@@ -20,131 +12,133 @@ def render_attendance_table(week_display, latest_attendance_data, all_attendance
         </div>
         """
 
+EMPTY_CELL = '<td class=""></td>'
+
+def _name_cells(names, flags, highlight):
+    """
+    Pre-format one column of <td> cells: highlighted names first, then by name.
+    ``flags`` marks the names that get ``highlight`` (None: no comparison week).
+    """
+    if flags is None:
+        flags = [False] * len(names)
+    entries = sorted(
+        ((name, highlight if is_new else '') for name, is_new in zip(names, flags)),
+        key=lambda x: (x[1] == '', x[0])
+    )
+    return [f'<td class="{css}">{name[:4]}</td>' for name, css in entries]
+
+def _stats_rows(label, counts, row_index):
+    """Total row plus one row per age category; ``row_index`` is the total row's position."""
+    rows = [f'<tr class="total-row"><td style="padding-left: 15px;">{label}</td><td>{counts["total"]}</td></tr>\n']
+    for offset, age in enumerate(AGE_CATEGORIES, start=1):
+        row_class = "even" if (row_index + offset) % 2 == 0 else "odd"
+        rows.append(f'<tr class="{row_class}"><td style="padding-left: 30px;">{age}</td><td>{counts["ages"][age]}</td></tr>\n')
+    return rows
+
+def render_attendance_table(week_display, latest_attendance_data, all_attendance_data, latest_district_counts, latest_main_district_counts, compare_week_display=None):
+    """
+    Render the attendance and stats tables for one week. Names are highlighted
+    against ``compare_week_display`` (default: the week before), using the
+    per-district member-ID arrays so each lookup is a sorted-array membership test.
+    """
+    return ''.join(iter_attendance_sections(
+        week_display, latest_attendance_data, all_attendance_data,
+        latest_district_counts, latest_main_district_counts, compare_week_display
+    )) or NO_DATA_HTML
+
+def iter_attendance_sections(week_display, latest_attendance_data, all_attendance_data, latest_district_counts, latest_main_district_counts, compare_week_display=None):
+    """
+    Yield render_attendance_table's output one main-district section at a time
+    (nothing when the week has no sub-district data). Each section is assembled
+    from pre-formatted cell strings and joined once.
+    """
+    attended = latest_attendance_data['attended']
+    not_attended = latest_attendance_data['not_attended']
+
+    # 只保留具體子區（排除僅有大區的鍵）
+    districts = sorted(
+        [d for d in set(attended).union(not_attended) if parse_district(d)[1]],
+        key=parse_district
+    )
+    if not districts:
+        return
+
     previous_week_data = None
-    all_attendance_data.sort(key=lambda x: x[0])
-    current_week_idx = next((idx for idx, (date, data, week_name) in enumerate(all_attendance_data) if week_name == week_display), None)
-    
-    if current_week_idx is not None and current_week_idx > 0:
-        previous_week_data = all_attendance_data[current_week_idx - 1][1]
+    all_attendance_data = sorted(all_attendance_data, key=lambda x: x[0])
+    if compare_week_display is not None:
+        previous_week_data = next((data for date, data, week_name in all_attendance_data if week_name == compare_week_display), None)
+    else:
+        current_week_idx = next((idx for idx, (date, data, week_name) in enumerate(all_attendance_data) if week_name == week_display), None)
+        if current_week_idx is not None and current_week_idx > 0:
+            _, previous_week_data, compare_week_display = all_attendance_data[current_week_idx - 1]
+    # 標題註明比較的週次
+    compare_note = f'（比較：{compare_week_display}）' if previous_week_data else ''
 
     main_districts = sorted(set(parse_district(d)[0] for d in districts), key=lambda x: chinese_to_int(x[0]))
     district_groups = {md: [d for d in districts if d.startswith(md)] for md in main_districts}
-
-    html = ""
-    age_categories = ['青職以上', '大專', '中學', '大學', '小學', '學齡前']
+    stats_districts = sorted([d for d in latest_district_counts if d != '總計'], key=parse_district)
 
     for main_district in main_districts:
         sub_districts = district_groups[main_district]
         if not sub_districts:
             continue
 
-        max_len = max(max(len(latest_attendance_data['attended'].get(d, [])), len(latest_attendance_data['not_attended'].get(d, []))) for d in sub_districts)
-
-        sorted_attended = {}
-        sorted_not_attended = {}
+        # 每個子區兩欄（到會、未到會），先格式化並補齊到相同列數
+        columns = []
         for district in sub_districts:
-            attended_list = latest_attendance_data['attended'].get(district, [])
-            not_attended_list = latest_attendance_data['not_attended'].get(district, [])
-            
-            attended_with_highlights = []
-            not_attended_with_highlights = []
+            newly_attending = newly_absent = None
             if previous_week_data:
-                prev_attended = previous_week_data['attended'].get(district, [])
-                prev_not_attended = previous_week_data['not_attended'].get(district, [])
-                
-                for name in attended_list:
-                    display_name = name[:4] if len(name) > 4 else name
-                    highlight = 'highlight-green' if name in prev_not_attended else ''
-                    attended_with_highlights.append((name, display_name, highlight))
-                
-                for name in not_attended_list:
-                    display_name = name[:4] if len(name) > 4 else name
-                    highlight = 'highlight-red' if name in prev_attended else ''
-                    not_attended_with_highlights.append((name, display_name, highlight))
-            else:
-                attended_with_highlights = [(name, name[:4] if len(name) > 4 else name, '') for name in attended_list]
-                not_attended_with_highlights = [(name, name[:4] if len(name) > 4 else name, '') for name in not_attended_list]
-            
-            attended_with_highlights.sort(key=lambda x: (x[2] == '', x[0]))
-            not_attended_with_highlights.sort(key=lambda x: (x[2] == '', x[0]))
-            
-            sorted_attended[district] = attended_with_highlights
-            sorted_not_attended[district] = not_attended_with_highlights
+                # 本週到會且比較週未到會 → 綠；本週未到會且比較週到會 → 紅
+                newly_attending = np.isin(
+                    latest_attendance_data['attended_ids'].get(district, EMPTY_IDS),
+                    previous_week_data['not_attended_ids'].get(district, EMPTY_IDS),
+                    assume_unique=True
+                ).tolist()
+                newly_absent = np.isin(
+                    latest_attendance_data['not_attended_ids'].get(district, EMPTY_IDS),
+                    previous_week_data['attended_ids'].get(district, EMPTY_IDS),
+                    assume_unique=True
+                ).tolist()
+            columns.append(_name_cells(attended.get(district, []), newly_attending, 'highlight-green'))
+            columns.append(_name_cells(not_attended.get(district, []), newly_absent, 'highlight-red'))
+        max_len = max(len(column) for column in columns)
+        for column in columns:
+            column.extend([EMPTY_CELL] * (max_len - len(column)))
 
         # 開始大區區塊
-        html += f'<div class="district-section">\n'
-        html += f'<h2>{main_district} - {week_display}</h2>\n'
-        html += '<div class="district-container">\n'
+        parts = []
+        parts.append(
+            f'<div class="district-section">\n'
+            f'<h2>{main_district} - {week_display}{compare_note}</h2>\n'
+            '<div class="district-container">\n'
+            '<div class="table-wrapper attendance-wrapper">\n<table class="excel-table">\n'
+            f'<tr class="header"><th colspan="{len(columns)}">{main_district}</th></tr>\n'
+            '<tr class="district-row">\n'
+        )
+        parts.append(''.join(f'<th colspan="2">{district}</th>' for district in sub_districts))
+        parts.append('</tr>\n<tr class="subheader">\n')
+        parts.append('<th>本週到會</th><th>未到會</th>' * len(sub_districts))
+        parts.append('</tr>\n')
 
         # 出勤名單表
-        html += '<div class="table-wrapper attendance-wrapper">\n<table class="excel-table">\n'
-        total_cols = len(sub_districts) * 2
-        html += f'<tr class="header"><th colspan="{total_cols}">{main_district}</th></tr>\n'
-        html += '<tr class="district-row">\n'
-        for district in sub_districts:
-            html += f'<th colspan="2">{district}</th>'
-        html += '</tr>\n'
-        html += '<tr class="subheader">\n'
-        for _ in sub_districts:
-            html += '<th>本週到會</th><th>未到會</th>'
-        html += '</tr>\n'
-
-        for r in range(max_len):
-            row_class = "even" if r % 2 == 0 else "odd"
-            html += f'<tr class="{row_class}">\n'
-            for district in sub_districts:
-                attended_with_highlights = sorted_attended.get(district, [])
-                not_attended_with_highlights = sorted_not_attended.get(district, [])
-                attended_info = attended_with_highlights[r] if r < len(attended_with_highlights) else ('', '', '')
-                not_attended_info = not_attended_with_highlights[r] if r < len(not_attended_with_highlights) else ('', '', '')
-                attended_display = attended_info[1]
-                not_attended_display = not_attended_info[1]
-                attended_class = attended_info[2]
-                not_attended_class = not_attended_info[2]
-                html += f'<td class="{attended_class}">{attended_display}</td><td class="{not_attended_class}">{not_attended_display}</td>'
-            html += '</tr>\n'
-        html += '</table>\n</div>\n'
+        for r, row in enumerate(zip(*columns)):
+            parts.append('<tr class="even">\n' if r % 2 == 0 else '<tr class="odd">\n')
+            parts.append(''.join(row))
+            parts.append('</tr>\n')
+        parts.append('</table>\n</div>\n')
 
         # 統計表（總計移至標題行並染色）
-        stats_districts = sorted([d for d in latest_district_counts.keys() if d != '總計'], key=parse_district)
         sub_districts_stats = [d for d in stats_districts if d.startswith(main_district)]
         if sub_districts_stats:
-            html += '<div class="table-wrapper stats-wrapper">\n<table class="excel-table">\n'
-            html += f'<tr class="header"><th colspan="2">{main_district} 統計</th></tr>\n'
+            parts.append('<div class="table-wrapper stats-wrapper">\n<table class="excel-table">\n')
+            parts.append(f'<tr class="header"><th colspan="2">{main_district} 統計</th></tr>\n')
+            # 子區統計，接著主區統計；斑馬紋依統計表內的列序
             row_index = 0
-            
-            # 子區統計
             for district in sub_districts_stats:
-                total = latest_district_counts[district]['total']
-                html += f'<tr class="total-row"><td style="padding-left: 15px;">{district}</td><td>{total}</td></tr>\n'
-                row_index += 1
-                for age in age_categories:
-                    count = latest_district_counts[district]['ages'][age]
-                    row_class = "even" if row_index % 2 == 0 else "odd"
-                    html += f'<tr class="{row_class}"><td style="padding-left: 30px;">{age}</td><td>{count}</td></tr>\n'
-                    row_index += 1
-            
-            # 主區統計
-            total = latest_main_district_counts[main_district]['total']
-            html += f'<tr class="total-row"><td style="padding-left: 15px;">{main_district}</td><td>{total}</td></tr>\n'
-            row_index += 1
-            for age in age_categories:
-                count = latest_main_district_counts[main_district]['ages'][age]
-                row_class = "even" if row_index % 2 == 0 else "odd"
-                html += f'<tr class="{row_class}"><td style="padding-left: 30px;">{age}</td><td>{count}</td></tr>\n'
-                row_index += 1
-
-            html += '</table>\n</div>\n'
-
-        html += '</div>\n</div>\n'
-
-    if not html:
-        html = """
-        <div class="district-section">
-            <table class="excel-table">
-                <tr class="title-row"><th>該週無有效數據</th></tr>
-            </table>
-        </div>
-        """
+                parts.extend(_stats_rows(district, latest_district_counts[district], row_index))
+                row_index += len(AGE_CATEGORIES) + 1
+            parts.extend(_stats_rows(main_district, latest_main_district_counts[main_district], row_index))
+            parts.append('</table>\n</div>\n')
 
-    return html
+        parts.append('</div>\n</div>\n')
+        yield ''.join(parts)
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from utils import link_or_copy
+from config import logger, RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL, STREAMING_WORKBOOK
+from metrics import cache_requests
+
+# 結果格式變動時遞增，使舊快取失效
+CACHE_VERSION = 5
+# 計算雜湊時每次讀入的大小
+HASH_CHUNK = 1024 * 1024
+
+
+class ResultCache:
+    """
+    Disk-backed cache of process_excel results keyed by the SHA-256 of the upload.
+
+    Each entry is a pickled result (``<key>.pkl``) plus, for single uploads, a
+    link to the input file (``<key>.input``) the output workbook is generated
+    from on download. Entries expire ``ttl`` seconds after being written and
+    the least recently used ones are evicted once the directory exceeds
+    ``max_bytes``.
+    """
+
+    def __init__(self, directory, max_bytes, ttl):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(path, file_extension):
+        """Cache key of the upload at ``path``, hashed in chunks rather than read whole."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+        digest.update(f"|{file_extension}|{STREAMING_WORKBOOK}|{CACHE_VERSION}".encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def _input_path(self, key):
+        return os.path.join(self.directory, key + '.input')
+
+    def _remove(self, key):
+        for path in (self._path(key), self._input_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, key):
+        meta_path = self._path(key)
+        try:
+            with open(meta_path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self._count(hit=False, key=key)
+            return None
+
+        if time.time() - entry['created'] > self.ttl:
+            logger.info(f"Result cache entry {key[:12]} expired")
+            self._remove(key)
+            self._count(hit=False, key=key)
+            return None
+
+        result = entry['result']
+        source = result['output_source']
+        if source is not None and source['kind'] == 'upload':
+            if not os.path.exists(self._input_path(key)):
+                self._remove(key)
+                self._count(hit=False, key=key)
+                return None
+            result['output_source'] = dict(source, path=self._input_path(key))
+
+        os.utime(meta_path)  # 更新最近使用時間，供 LRU 淘汰
+        self._count(hit=True, key=key)
+        return result
+
+    def put(self, key, result):
+        meta_path = self._path(key)
+        source = result['output_source']
+        if source is not None and source['kind'] == 'upload':
+            # 保存輸入檔供日後產生輸出檔；上傳暫存檔於請求結束後即刪除
+            input_path = self._input_path(key)
+            tmp_input_path = f'{input_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            link_or_copy(source['path'], tmp_input_path)
+            os.replace(tmp_input_path, input_path)
+            result = dict(result, output_source=dict(source, path=None))
+        entry = {'created': time.time(), 'result': result}
+
+        # 先寫暫存檔再 rename，避免其他請求讀到寫到一半的檔案
+        tmp_path = f'{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, meta_path)
+        self._evict()
+
+    def _evict(self):
+        entries = {}
+        inputs = {}
+        for filename in os.listdir(self.directory):
+            key, ext = os.path.splitext(filename)
+            if ext not in ('.pkl', '.input'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                continue
+            if ext == '.pkl':
+                entries[key] = (stat.st_size, stat.st_mtime)
+            else:
+                inputs[key] = stat.st_size
+        # 輸入檔計入所屬項目的大小；最近使用時間以 .pkl 為準
+        entries = {key: (size + inputs.get(key, 0), last_used) for key, (size, last_used) in entries.items()}
+
+        now = time.time()
+        total = sum(size for size, _ in entries.values())
+        for key, (size, last_used) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes and now - last_used <= self.ttl:
+                continue
+            logger.info(f"Evicting result cache entry {key[:12]} ({size} bytes)")
+            self._remove(key)
+            total -= size
+
+    def _count(self, hit, key):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            hits, misses = self.hits, self.misses
+        # 各行程的次數經 /metrics 加總
+        cache_requests.inc('hit' if hit else 'miss')
+        logger.info(f"Result cache {'hit' if hit else 'miss'} for {key[:12]} (hits={hits}, misses={misses})")
+
+
+_cache = None
+
+
+def get_result_cache():
+    """Return the process-wide result cache, or None when RESULT_CACHE_MAX_BYTES is 0."""
+    global _cache
+    if RESULT_CACHE_MAX_BYTES <= 0:
+        return None
+    if _cache is None:
+        _cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+    return _cache
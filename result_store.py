@@ -0,0 +1,239 @@
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from config import logger, RESULT_STORE_DIR, RESULT_STORE_TTL, RESULT_STORE_LRU_SIZE
+from cube import AttendanceCube
+from metrics import timed
+from utils import link_or_copy
+
+META_FILE = 'meta.pkl'
+ROSTER_FILE = 'roster.pkl'
+CUBE_FILE = 'cube.pkl'
+SOURCE_FILE = 'source.pkl'
+OUTPUT_FILE = 'output.xlsx'
+
+
+class ResultStore:
+    """
+    Server-side store for analysed uploads; the session only keeps the result ID.
+
+    Each result is a directory holding a small ``meta.pkl`` (latest-week fields
+    and the week list), the member table in ``roster.pkl``, one ``week_<idx>.pkl``
+    of per-district member-ID arrays per week in date order, the district ×
+    age × week counts in ``cube.pkl`` and, in ``source.pkl``, what is needed
+    to write the output workbook (for single uploads, a link to the input
+    file kept as ``source.xls``/``source.xlsx``). ``output.xlsx`` is only
+    generated on the first download. Every endpoint reads only the slice it needs.
+    Recently loaded slices are kept in an in-process LRU; results expire
+    ``ttl`` seconds after they were saved.
+    """
+
+    def __init__(self, directory, ttl, lru_size):
+        self.directory = directory
+        self.ttl = ttl
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, result_id, name=''):
+        return os.path.join(self.directory, result_id, name)
+
+    @staticmethod
+    def _valid_id(result_id):
+        return isinstance(result_id, str) and len(result_id) == 32 and result_id.isalnum()
+
+    @timed('store')
+    def save(self, result):
+        """Persist a process_excel result and return its new result ID."""
+        self.expire()
+        result_id = uuid.uuid4().hex
+        tmp_dir = self._path(f'.{result_id}.tmp')
+        os.makedirs(tmp_dir)
+
+        all_attendance_data = sorted(result['all_attendance_data'], key=lambda x: x[0])
+        week_names = [week_name for _, _, week_name in all_attendance_data]
+        meta = {
+            'latest_analytic_date': result['latest_analytic_date'],
+            'latest_week_display': result['latest_week_display'],
+            'latest_week_idx': week_names.index(result['latest_week_display']),
+            'latest_district_counts': result['latest_district_counts'],
+            'latest_main_district': result['latest_main_district'],
+            'latest_main_district_counts': result['latest_main_district_counts'],
+            'weeks': [(date, week_name) for date, _, week_name in all_attendance_data],
+        }
+        with open(os.path.join(tmp_dir, META_FILE), 'wb') as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp_dir, ROSTER_FILE), 'wb') as f:
+            pickle.dump(result['roster'], f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp_dir, CUBE_FILE), 'wb') as f:
+            pickle.dump(AttendanceCube(result['roster'], meta['weeks']), f, protocol=pickle.HIGHEST_PROTOCOL)
+        for idx, (_, attendance_data, _) in enumerate(all_attendance_data):
+            # 姓名由 roster 還原，每週只存成員 ID
+            week_ids = {key: attendance_data[key] for key in ('attended_ids', 'not_attended_ids')}
+            with open(os.path.join(tmp_dir, f'week_{idx}.pkl'), 'wb') as f:
+                pickle.dump(week_ids, f, protocol=pickle.HIGHEST_PROTOCOL)
+        source = result['output_source']
+        if source['kind'] == 'upload':
+            # 輸入檔以硬連結保存（跨檔案系統時複製），路徑改存相對於結果目錄的檔名
+            filename = f"source{source['extension']}"
+            link_or_copy(source['path'], os.path.join(tmp_dir, filename))
+            source = dict(source, path=filename)
+        with open(os.path.join(tmp_dir, SOURCE_FILE), 'wb') as f:
+            pickle.dump(source, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.rename(tmp_dir, self._path(result_id))
+        logger.info(f"Stored result {result_id} with {len(all_attendance_data)} weeks")
+        return result_id
+
+    def _expired(self, result_id):
+        try:
+            return time.time() - os.path.getmtime(self._path(result_id, META_FILE)) > self.ttl
+        except OSError:
+            return True
+
+    def _load(self, result_id, name):
+        if not self._valid_id(result_id) or self._expired(result_id):
+            return None
+        cache_key = (result_id, name)
+        with self._lock:
+            if cache_key in self._lru:
+                self._lru.move_to_end(cache_key)
+                return self._lru[cache_key]
+        try:
+            with open(self._path(result_id, name), 'rb') as f:
+                obj = pickle.load(f)
+        except OSError:
+            return None
+        with self._lock:
+            self._lru[cache_key] = obj
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+        return obj
+
+    def load_table(self, result_id, name):
+        return self._load(result_id, name)
+
+    def save_table(self, result_id, name, table):
+        """Persist a rendered table next to the result so every worker can reuse it."""
+        path = self._path(result_id, name)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as e:  # 結果可能已過期被刪除
+            logger.warning(f"Could not cache {name} for result {result_id}: {str(e)}")
+            return
+        with self._lock:
+            self._lru[(result_id, name)] = table
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def load_meta(self, result_id):
+        return self._load(result_id, META_FILE)
+
+    def load_roster(self, result_id):
+        if self.load_meta(result_id) is None:
+            return None
+        return self._load(result_id, ROSTER_FILE)
+
+    def load_cube(self, result_id):
+        meta = self.load_meta(result_id)
+        if meta is None:
+            return None
+        cube = self._load(result_id, CUBE_FILE)
+        if cube is None:
+            # 舊版結果沒有 cube.pkl，由名單補建一次
+            roster = self._load(result_id, ROSTER_FILE)
+            if roster is None:
+                return None
+            cube = AttendanceCube(roster, meta['weeks'])
+            self.save_table(result_id, CUBE_FILE, cube)
+        return cube
+
+    def load_week(self, result_id, week_idx):
+        """Return (date, attendance_data, week_name) for one week, or None."""
+        meta = self.load_meta(result_id)
+        if meta is None or week_idx < 0 or week_idx >= len(meta['weeks']):
+            return None
+        roster = self._load(result_id, ROSTER_FILE)
+        week_ids = self._load(result_id, f'week_{week_idx}.pkl')
+        if roster is None or week_ids is None:
+            return None
+        attendance_data = {
+            'attended': roster.names_of(week_ids['attended_ids']),
+            'not_attended': roster.names_of(week_ids['not_attended_ids']),
+            'attended_ids': week_ids['attended_ids'],
+            'not_attended_ids': week_ids['not_attended_ids'],
+        }
+        date, week_name = meta['weeks'][week_idx]
+        return date, attendance_data, week_name
+
+    def has_output(self, result_id):
+        """Whether the result can produce an output workbook (generated or not)."""
+        if not self._valid_id(result_id) or self._expired(result_id):
+            return False
+        return os.path.exists(self._path(result_id, SOURCE_FILE))
+
+    def load_source(self, result_id):
+        if not self.has_output(result_id):
+            return None
+        try:
+            with open(self._path(result_id, SOURCE_FILE), 'rb') as f:
+                source = pickle.load(f)
+        except OSError:
+            return None
+        if source['kind'] == 'upload':
+            source['path'] = self._path(result_id, source['path'])
+        return source
+
+    def output_path(self, result_id):
+        """Path of the already generated output workbook, or None."""
+        if not self._valid_id(result_id) or self._expired(result_id):
+            return None
+        path = self._path(result_id, OUTPUT_FILE)
+        return path if os.path.exists(path) else None
+
+    @timed('output')
+    def save_output(self, result_id, write):
+        """Generate output.xlsx by calling ``write(path)`` on a temporary file; returns the final path."""
+        path = self._path(result_id, OUTPUT_FILE)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    def expire(self):
+        """Delete results older than the TTL."""
+        now = time.time()
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            try:
+                if now - os.path.getmtime(path) <= self.ttl:
+                    continue
+            except OSError:
+                continue
+            logger.info(f"Removing expired result {entry}")
+            shutil.rmtree(path, ignore_errors=True)
+        with self._lock:
+            for cache_key in [k for k in self._lru if self._expired(k[0])]:
+                del self._lru[cache_key]
+
+
+_store = None
+
+
+def get_result_store():
+    global _store
+    if _store is None:
+        _store = ResultStore(RESULT_STORE_DIR, RESULT_STORE_TTL, RESULT_STORE_LRU_SIZE)
+    return _store
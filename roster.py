@@ -0,0 +1,195 @@
+import numpy as np
+from config import logger, START_COLUMN, AGE_CATEGORIES, YOUTH_ABOVE
+from metrics import timed
+
+# 名單欄位（0 起算）：大區、小區、姓名、年齡
+MAIN_DISTRICT_COL = 0
+SUB_DISTRICT_COL = 1
+NAME_COL = 3
+AGE_COL = 5
+
+
+class Roster:
+    """
+    Member table plus a compact members × weeks attendance matrix.
+
+    Built by a single pass over the active sheet; every week's classification
+    is derived from ``matrix`` instead of re-reading the worksheet.
+    """
+
+    def __init__(self, main_district, main_districts, districts, names, ages, week_cols, matrix, known=None):
+        self.main_district = main_district
+        self.main_districts = main_districts  # 每位成員的大區
+        self.districts = districts            # 每位成員的完整區名，例如 "二大區三"
+        self.names = names
+        self.ages = ages                      # 已換算為 AGE_CATEGORIES 之一
+        self.week_cols = week_cols            # [(col, week_header, month_prefix), ...]
+        self.matrix = matrix                  # uint8, shape = (len(names), len(week_cols))
+        # 與 matrix 同形狀：該成員的來源檔是否有這一週；None 表示每位成員每週都有紀錄
+        self.known = known
+
+        # 成員 ID 即成員在名單中的序號；各區的成員 ID 依名單順序排列
+        self.age_codes = np.array([AGE_CATEGORIES.index(age) for age in ages], dtype=np.uint8)
+        self.district_ids = _group_ids(districts)
+        self.main_district_ids = _group_ids(main_districts)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getstate__(self):
+        # 出席矩陣以位元壓縮後再序列化
+        state = self.__dict__.copy()
+        state['matrix'] = (np.packbits(self.matrix, axis=0), self.matrix.shape)
+        if self.known is not None:
+            state['known'] = (np.packbits(self.known, axis=0), self.known.shape)
+        return state
+
+    def __setstate__(self, state):
+        packed, shape = state['matrix']
+        state['matrix'] = np.unpackbits(packed, axis=0, count=shape[0]).reshape(shape)
+        known = state.get('known')
+        if known is not None:
+            packed, shape = known
+            state['known'] = np.unpackbits(packed, axis=0, count=shape[0]).reshape(shape)
+        else:
+            state['known'] = None
+        self.__dict__.update(state)
+
+    def known_in(self, week_idx):
+        """Boolean vector of the members recorded in one week column, or None when all are."""
+        if self.known is None:
+            return None
+        return self.known[:, week_idx].astype(bool)
+
+    def split_week(self, present, known=None):
+        """
+        Split a boolean presence vector into per-district sorted member-ID arrays.
+        Returns (attended_ids, not_attended_ids); districts without members on
+        one side are left out of that dict. Members outside ``known`` (when
+        given) are on neither side.
+        """
+        attended_ids = {}
+        not_attended_ids = {}
+        for district, ids in self.district_ids.items():
+            if known is not None:
+                ids = ids[known[ids]]
+                if not len(ids):
+                    continue
+            mask = present[ids]
+            if mask.any():
+                attended_ids[district] = ids[mask]
+            if not mask.all():
+                not_attended_ids[district] = ids[~mask]
+        return attended_ids, not_attended_ids
+
+    def week_counts(self, present):
+        """
+        (district_counts, main_district_counts) for a boolean presence vector,
+        in classify_attendance's format (district_counts includes '總計').
+        """
+        district_counts = {}
+        for district, ids in self.district_ids.items():
+            ids = ids[present[ids]]
+            if len(ids):
+                district_counts[district] = self.age_counts(ids)
+        main_district_counts = {}
+        for main_district_value, ids in self.main_district_ids.items():
+            ids = ids[present[ids]]
+            if len(ids):
+                main_district_counts[main_district_value] = self.age_counts(ids)
+        district_counts['總計'] = sum(d['total'] for d in district_counts.values())
+        return district_counts, main_district_counts
+
+    def presence(self, ids_by_district):
+        """Boolean presence vector from per-district member-ID arrays."""
+        present = np.zeros(len(self.names), dtype=bool)
+        for ids in ids_by_district.values():
+            present[ids] = True
+        return present
+
+    def names_of(self, ids_by_district):
+        return {district: [self.names[i] for i in ids.tolist()] for district, ids in ids_by_district.items()}
+
+    def age_counts(self, ids):
+        """{'total': n, 'ages': {category: n}} for the given member IDs."""
+        counts = np.bincount(self.age_codes[ids], minlength=len(AGE_CATEGORIES)).tolist()
+        return {'total': len(ids), 'ages': dict(zip(AGE_CATEGORIES, counts))}
+
+
+def _group_ids(keys):
+    groups = {}
+    for member, key in enumerate(keys):
+        groups.setdefault(key, []).append(member)
+    return {key: np.array(ids, dtype=np.int32) for key, ids in groups.items()}
+
+
+def _cell(row, idx):
+    return row[idx] if idx < len(row) else None
+
+
+def effective_age(age):
+    """Map a raw age cell onto one of AGE_CATEGORIES."""
+    if age in YOUTH_ABOVE or not age:
+        return '青職以上'
+    if age not in AGE_CATEGORIES:
+        return None
+    return age
+
+
+def detect_week_columns(month_row, week_row):
+    """Return [(col, week_header, month_prefix), ...] from the two header rows."""
+    week_cols = []
+    current_month = "2025年1月"
+    last_col = max(len(month_row), len(week_row))
+    for col in range(START_COLUMN, last_col):
+        month_header = str(_cell(month_row, col) or "")
+        week_header = str(_cell(week_row, col) or "")
+        if "年" in month_header and "月" in month_header:
+            current_month = month_header.strip()
+        if "週" in week_header:
+            week_cols.append((col, week_header, current_month))
+    return week_cols
+
+
+def read_roster(sheet):
+    """Read the roster and all week columns from ``sheet`` with one iter_rows pass."""
+    rows = sheet.iter_rows(values_only=True)
+    with timed('header_scan'):
+        month_row = next(rows, ())
+        week_row = next(rows, ())
+        week_cols = detect_week_columns(month_row, week_row)
+    logger.info(f"Detected week columns with months: {week_cols}")
+    cols = [col for col, _, _ in week_cols]
+
+    main_district = None
+    main_districts = []
+    districts = []
+    names = []
+    ages = []
+    attendance_rows = []
+    for row in rows:
+        name = _cell(row, NAME_COL)
+        if not name:
+            continue
+        main_district_value = str(_cell(row, MAIN_DISTRICT_COL) or "").strip()
+        sub_district = str(_cell(row, SUB_DISTRICT_COL) or "").strip()
+        district = f"{main_district_value}{sub_district}"
+        age = str(_cell(row, AGE_COL) or "").strip()
+        if main_district is None and main_district_value:
+            main_district = main_district_value
+            logger.debug(f"Set main district name to: {main_district}")
+
+        age_category = effective_age(age)
+        if age_category is None:
+            logger.warning(f"Unrecognized age '{age}' for {name} in {district}, defaulting to '青職以上'")
+            age_category = '青職以上'
+
+        main_districts.append(main_district_value)
+        districts.append(district)
+        names.append(name)
+        ages.append(age_category)
+        attendance_rows.append([1 if _cell(row, col) == 1 else 0 for col in cols])
+
+    matrix = np.array(attendance_rows, dtype=np.uint8).reshape(len(names), len(cols))
+    logger.debug(f"Roster loaded: {len(names)} members x {len(cols)} weeks")
+    return Roster(main_district, main_districts, districts, names, ages, week_cols, matrix)
@@ -0,0 +1,199 @@
+import atexit
+import http.client
+import multiprocessing
+import os
+import queue
+import shlex
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import xmlrpc.client
+from config import logger, SOFFICE_POOL_SIZE, SOFFICE_QUEUE_SIZE, SOFFICE_TIMEOUT, UNOSERVER_COMMAND
+
+WORKER_STARTUP_TIMEOUT = 60
+
+
+class PoolBusyError(Exception):
+    """Raised when the conversion queue is full or no worker frees up in time."""
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        return connection
+
+
+class _Worker:
+    """One long-lived headless LibreOffice (via unoserver) with its own profile."""
+
+    def __init__(self, index):
+        self.index = index
+        self.profile_dir = tempfile.mkdtemp(prefix=f'soffice-worker-{index}-')
+        self.process = None
+        self.port = None
+
+    def start(self):
+        self.port = _free_port()
+        command = shlex.split(UNOSERVER_COMMAND) + [
+            '--interface', '127.0.0.1',
+            '--port', str(self.port),
+            '--uno-port', str(_free_port()),
+            '--user-installation', f'file://{self.profile_dir}',
+        ]
+        logger.info(f"Starting LibreOffice worker {self.index} on port {self.port}")
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + WORKER_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"LibreOffice worker {self.index} exited with code {self.process.returncode}")
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"LibreOffice worker {self.index} did not start within {WORKER_STARTUP_TIMEOUT}s")
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.process is None:
+            return
+        self.process.kill()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            logger.error(f"LibreOffice worker {self.index} did not exit after kill")
+        self.process = None
+
+    def restart(self):
+        logger.warning(f"Restarting LibreOffice worker {self.index}")
+        self.stop()
+        self.start()
+
+    def convert(self, src_path, dst_path, timeout):
+        proxy = xmlrpc.client.ServerProxy(
+            f'http://127.0.0.1:{self.port}', transport=_TimeoutTransport(timeout), allow_none=True
+        )
+        proxy.convert(src_path, None, dst_path, 'xlsx', None)
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class ConversionPool:
+    """
+    Fixed-size pool of warm LibreOffice workers fed through a bounded queue.
+
+    A job waits at most ``timeout`` seconds for a free worker and another
+    ``timeout`` seconds for the conversion; hung or crashed workers are restarted.
+    """
+
+    def __init__(self, size, queue_size, timeout):
+        self.size = size
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._idle = queue.Queue()
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._workers = [_Worker(i) for i in range(size)]
+        try:
+            for worker in self._workers:
+                worker.start()
+                self._idle.put(worker)
+        except (OSError, RuntimeError):
+            self.close()
+            raise
+
+    @property
+    def queue_depth(self):
+        return self._waiting
+
+    def convert(self, src_path, dst_path):
+        with self._lock:
+            if self._waiting >= self.queue_size:
+                raise PoolBusyError(f"Conversion queue is full ({self._waiting} waiting)")
+            self._waiting += 1
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolBusyError(f"No LibreOffice worker became free within {self.timeout}s")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        try:
+            if not worker.alive():
+                worker.restart()
+            worker.convert(src_path, dst_path, self.timeout)
+        except (OSError, http.client.HTTPException, xmlrpc.client.Error) as e:
+            # 逾時或連線中斷時，視為 worker 已當掉並重新啟動
+            logger.error(f"LibreOffice worker {worker.index} failed: {str(e)}")
+            try:
+                worker.restart()
+            except RuntimeError as restart_error:
+                logger.error(str(restart_error))
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()
+
+
+_pool = None
+_pool_failed = False
+_pool_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # fork 出的子行程不可使用父行程的 worker（不在其閒置佇列中）；
+    # 也不可在結束時關閉父行程的 soffice
+    global _pool, _pool_failed, _pool_lock
+    if _pool is not None:
+        atexit.unregister(_pool.close)
+    _pool = None
+    _pool_failed = False
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_pool():
+    """
+    Return this process's conversion pool, starting it on first use.
+    Returns None when the pool is disabled, its workers could not be started,
+    or this is a multiprocessing child (batch and job pools): atexit does not
+    run there, so a pool it started would leak its soffice processes.
+    """
+    global _pool, _pool_failed
+    if SOFFICE_POOL_SIZE <= 0 or _pool_failed or multiprocessing.parent_process() is not None:
+        return None
+    with _pool_lock:
+        if _pool is None and not _pool_failed:
+            try:
+                _pool = ConversionPool(SOFFICE_POOL_SIZE, SOFFICE_QUEUE_SIZE, SOFFICE_TIMEOUT)
+                atexit.register(_pool.close)
+            except (OSError, RuntimeError) as e:
+                logger.error(f"Could not start LibreOffice pool, falling back to one soffice per upload: {str(e)}")
+                _pool_failed = True
+    return _pool
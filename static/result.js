@@ -0,0 +1,57 @@
+// 比較選單只提供所選週之前的週；原本選的週不再適用時改回「上一週」
+function filterCompareOptions() {
+    var weekIdx = parseInt(document.getElementById('weekSelector').value, 10);
+    var compareSelector = document.getElementById('compareSelector');
+    Array.prototype.forEach.call(compareSelector.options, function(option) {
+        var unavailable = option.value !== '' && parseInt(option.value, 10) >= weekIdx;
+        option.hidden = unavailable;
+        option.disabled = unavailable;
+    });
+    if (compareSelector.selectedOptions.length && compareSelector.selectedOptions[0].disabled) {
+        compareSelector.value = '';
+    }
+}
+
+function showError(message) {
+    var error = document.getElementById('tableError');
+    error.textContent = message;
+    error.hidden = !message;
+}
+
+// 依週選單與比較選單載入該週的出席表
+function updateTable() {
+    var weekIdx = document.getElementById('weekSelector').value;
+    var compareIdx = document.getElementById('compareSelector').value;
+    var url = '/get_week_data/' + weekIdx + (compareIdx === '' ? '' : '?compare=' + encodeURIComponent(compareIdx));
+    fetch(url, {credentials: 'same-origin'})
+        .then(function(response) {
+            if (!response.ok) {
+                throw new Error(response.status + ' ' + response.statusText);
+            }
+            return response.json();
+        })
+        .then(function(data) {
+            if (data.attendance_table) {
+                document.getElementById('attendanceTable').innerHTML = data.attendance_table;
+                showError('');
+                console.log('Table updated successfully');
+            } else {
+                console.error('No attendance_table in response:', data);
+                showError('無法載入該週資料，請重新選擇。');
+            }
+        })
+        .catch(function(error) {
+            console.error('Request error:', error);
+            showError('無法載入該週資料（' + error.message + '），請稍後再試。');
+        });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.getElementById('weekSelector').addEventListener('change', function() {
+        filterCompareOptions();
+        updateTable();
+    });
+    document.getElementById('compareSelector').addEventListener('change', updateTable);
+    filterCompareOptions();
+    updateTable();
+});
@@ -0,0 +1,110 @@
+import numpy as np
+from config import TREND_WINDOWS, AT_RISK_STREAK
+
+TREND_HEADER = ['大區', '區', '姓名', '年齡', '連續缺席週數', '最長連續缺席週數'] + \
+    [f'近{window}週出席率' for window in TREND_WINDOWS] + ['缺席幾週後回來']
+
+
+def _week_columns(roster, week_names):
+    col_of = {f"{month_prefix}{week_name}": idx for idx, (_, week_name, month_prefix) in enumerate(roster.week_cols)}
+    return [col_of[name] for name in week_names]
+
+
+def week_matrix(roster, week_names):
+    """
+    Boolean members × weeks presence matrix whose columns are the roster's
+    week columns named by ``week_names`` (e.g. a result's weeks in date order).
+    """
+    return roster.matrix[:, _week_columns(roster, week_names)].astype(bool)
+
+
+def known_matrix(roster, week_names):
+    """
+    week_matrix's counterpart for the roster's ``known`` mask: which weeks
+    each member's file recorded. None when every member has every week.
+    """
+    if roster.known is None:
+        return None
+    return roster.known[:, _week_columns(roster, week_names)].astype(bool)
+
+
+def compute_trends(matrix, windows=TREND_WINDOWS, known=None):
+    """
+    Per-member trends as of the last column of a members × weeks presence
+    matrix, computed with whole-matrix numpy operations. Weeks outside
+    ``known`` (a mask like the matrix, None for all) count as neither
+    present nor absent:
+
+    - 'absence_streak': consecutive weeks absent up to and including the last week
+    - 'longest_absence': longest run of consecutive absences
+    - 'rates': {window: attendance rate over the member's recorded weeks among the last ``window``}
+    - 'returned_after': weeks away before attending the last week, for members
+      who had attended before the gap (0 otherwise)
+    - 'attended_weeks': weeks attended in total
+    """
+    members, weeks = matrix.shape
+    if weeks == 0:
+        zeros = np.zeros(members, dtype=np.int32)
+        return {
+            'absence_streak': zeros, 'longest_absence': zeros, 'returned_after': zeros, 'attended_weeks': zeros,
+            'rates': {window: np.zeros(members) for window in windows},
+        }
+
+    # 每格的連續缺席週數 = 累計缺席數 − 最近一次出席時的累計缺席數
+    absent_total = np.cumsum(~matrix if known is None else known & ~matrix, axis=1, dtype=np.int32)
+    at_last_presence = np.maximum.accumulate(np.where(matrix, absent_total, 0), axis=1)
+    runs = absent_total - at_last_presence
+
+    present_total = np.cumsum(matrix, axis=1, dtype=np.int32)
+    known_total = np.cumsum(known, axis=1, dtype=np.int32) if known is not None else None
+    rates = {}
+    for window in windows:
+        span = min(window, weeks)
+        before = present_total[:, -span - 1] if span < weeks else 0
+        if known_total is None:
+            rates[window] = (present_total[:, -1] - before) / span
+        else:
+            # 分母只算該成員來源檔有紀錄的週
+            recorded = known_total[:, -1] - (known_total[:, -span - 1] if span < weeks else 0)
+            rates[window] = np.divide(present_total[:, -1] - before, recorded,
+                                      out=np.zeros(members), where=recorded > 0)
+
+    # 首次出席前的週數不算「缺席後回來」
+    returned_after = np.where(matrix[:, -1] & (present_total[:, -2] > 0), runs[:, -2], 0) \
+        if weeks > 1 else np.zeros(members, dtype=np.int32)
+    return {
+        'absence_streak': runs[:, -1],
+        'longest_absence': runs.max(axis=1),
+        'rates': rates,
+        'returned_after': returned_after,
+        'attended_weeks': present_total[:, -1],
+    }
+
+
+def at_risk(trends):
+    """Member IDs absent for at least AT_RISK_STREAK weeks running who attended before, longest streak first."""
+    streak = trends['absence_streak']
+    ids = np.flatnonzero((streak >= AT_RISK_STREAK) & (trends['attended_weeks'] > 0))
+    return ids[np.argsort(-streak[ids], kind='stable')]
+
+
+def returned(trends):
+    """Member IDs who attended the last week after being away, longest absence first."""
+    away = trends['returned_after']
+    ids = np.flatnonzero(away > 0)
+    return ids[np.argsort(-away[ids], kind='stable')]
+
+
+def trend_rows(roster, all_attendance_data):
+    """Header plus one row per member for the output workbook's trend sheet, as of the latest week."""
+    week_names = [week_name for _, _, week_name in sorted(all_attendance_data, key=lambda x: x[0])]
+    trends = compute_trends(week_matrix(roster, week_names), known=known_matrix(roster, week_names))
+    columns = [trends['absence_streak'].tolist(), trends['longest_absence'].tolist()]
+    columns += [np.round(trends['rates'][window], 3).tolist() for window in TREND_WINDOWS]
+    columns.append(trends['returned_after'].tolist())
+
+    yield TREND_HEADER
+    for member, values in enumerate(zip(*columns)):
+        main_district_value = roster.main_districts[member]
+        district = roster.districts[member]
+        yield [main_district_value, district, roster.names[member], roster.ages[member]] + list(values)
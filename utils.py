@@ -1,5 +1,12 @@
+import os
+import shutil
 from config import logger
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 def chinese_to_int(chinese_num):
     """Convert Chinese numerals to Arabic integers."""
     numeral_map = {
@@ -27,4 +34,28 @@ def parse_district(district_name):
     sub_district_num = chinese_to_int(sub_part) if sub_part in ['一', '二', '三', '四', '五', '六', '七', '八', '九', '十'] else 0
     return (main_part, sub_district_num)
 
+def peak_rss_kb():
+    """Peak resident set size of this process in KB (None where unsupported)."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def link_or_copy(src, dst):
+    """Hard-link ``src`` to ``dst``, copying instead when they are on different file systems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def is_process_alive(pid):
+    """Whether a process with this pid still exists on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 行程存在但屬於其他使用者
+        return True
+    return True
+
 # 原有的 render_attendance_table 函數已移除，因為它現在位於 render_table.py 中
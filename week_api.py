@@ -0,0 +1,123 @@
+import numpy as np
+from config import AGE_CATEGORIES, AT_RISK_STREAK, TREND_WINDOWS
+from history_store import get_history_store
+from result_store import get_result_store
+from trends import at_risk, compute_trends, known_matrix, returned, week_matrix
+
+def _attended(attendance_data):
+    ids = list(attendance_data['attended_ids'].values())
+    return np.sort(np.concatenate(ids)) if ids else np.empty(0, dtype=np.int32)
+
+def roster_payload(result_id):
+    """Static member table for a result: index in each list is the member ID."""
+    roster = get_result_store().load_roster(result_id)
+    if roster is None:
+        return None
+    return {
+        'names': [str(name) for name in roster.names],
+        'districts': roster.districts,
+        'ages': roster.ages,
+        'age_categories': AGE_CATEGORIES,
+    }
+
+def week_payload(result_id, week_idx, base_idx=None):
+    """
+    Structured data for one week: attended member IDs and the week's counts.
+
+    With ``base_idx`` only the difference from that week is returned:
+    ``added`` (attended now, absent in the base week) and ``removed`` (the
+    reverse), which is enough for a client holding the base week to update.
+    Returns None when either week does not exist.
+    """
+    store = get_result_store()
+    roster = store.load_roster(result_id)
+    week = store.load_week(result_id, week_idx) if roster is not None else None
+    if week is None:
+        return None
+    base = None
+    if base_idx is not None:
+        base = store.load_week(result_id, base_idx)
+        if base is None:
+            return None
+
+    _, attendance_data, week_name = week
+    attended = _attended(attendance_data)
+    district_counts, main_district_counts = store.load_cube(result_id).week_counts(week_idx)
+    payload = {
+        'week_idx': week_idx,
+        'week': week_name,
+        'district_counts': district_counts,
+        'main_district_counts': main_district_counts,
+    }
+    if base is None:
+        payload['attended'] = attended.tolist()
+    else:
+        base_attended = _attended(base[1])
+        payload['base_idx'] = base_idx
+        payload['added'] = np.setdiff1d(attended, base_attended, assume_unique=True).tolist()
+        payload['removed'] = np.setdiff1d(base_attended, attended, assume_unique=True).tolist()
+    return payload
+
+def trends_payload(result_id, week_idx=None):
+    """
+    Member trends as of ``week_idx`` (default: the latest week). Per-member
+    lists are indexed by member ID as in roster_payload; ``at_risk`` and
+    ``returned`` list the member IDs to follow up. Returns None when the week
+    does not exist.
+    """
+    store = get_result_store()
+    meta = store.load_meta(result_id)
+    roster = store.load_roster(result_id) if meta is not None else None
+    if roster is None:
+        return None
+    if week_idx is None:
+        week_idx = len(meta['weeks']) - 1
+    if week_idx < 0 or week_idx >= len(meta['weeks']):
+        return None
+
+    week_names = [week_name for _, week_name in meta['weeks'][:week_idx + 1]]
+    trends = compute_trends(week_matrix(roster, week_names), known=known_matrix(roster, week_names))
+    return {
+        'week_idx': week_idx,
+        'week': week_names[-1],
+        'windows': list(TREND_WINDOWS),
+        'at_risk_streak': AT_RISK_STREAK,
+        'absence_streak': trends['absence_streak'].tolist(),
+        'longest_absence': trends['longest_absence'].tolist(),
+        'rates': {str(window): np.round(rate, 3).tolist() for window, rate in trends['rates'].items()},
+        'returned_after': trends['returned_after'].tolist(),
+        'at_risk': at_risk(trends).tolist(),
+        'returned': returned(trends).tolist(),
+    }
+
+def stats_payload(result_id, period='month', level='main_district', start=None, end=None):
+    """
+    Average weekly attendance per month or quarter between the optional
+    ``start`` and ``end`` dates, with the change from the previous period,
+    answered from the result's precomputed cube. Returns None when there is no result.
+    """
+    cube = get_result_store().load_cube(result_id)
+    if cube is None:
+        return None
+    return {
+        'period': period,
+        'level': level,
+        'age_categories': AGE_CATEGORIES,
+        'periods': cube.period_summary(period, level, start, end),
+    }
+
+def history_payload(district=None, start=None, end=None):
+    """
+    Weekly attendance per district across every upload recorded in the
+    history store, optionally for one district and between ``start`` and
+    ``end``. Returns None when the history store is disabled.
+    """
+    history = get_history_store()
+    if history is None:
+        return None
+    weeks = []
+    for label, week_date, week_district, attended, members in history.district_weeks(district, start, end):
+        if not weeks or weeks[-1]['week'] != label:
+            weeks.append({'week': label, 'date': week_date, 'districts': {}})
+        weeks[-1]['districts'][week_district] = {'attended': attended, 'members': members}
+    return {'weeks': weeks}
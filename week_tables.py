@@ -0,0 +1,134 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from compression import compress
+from config import logger
+from history_store import get_history_store
+from metrics import timed
+from render_table import NO_DATA_HTML, iter_attendance_sections, render_attendance_table
+from result_store import get_result_store
+
+_prerender_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prerender')
+
+def _week_with_previous(store, result_id, week_idx, compare_idx=None):
+    """
+    Load one week plus the week it is compared against (default: the week
+    before), the only slice render_attendance_table needs. The upload's first
+    week is compared against the week immediately before it in the
+    attendance history, when that week was stored.
+    """
+    if compare_idx is None:
+        compare_idx = week_idx - 1
+    weeks = [store.load_week(result_id, idx) for idx in (compare_idx, week_idx)]
+    weeks = [week for week in weeks if week is not None]
+    history = get_history_store()
+    if compare_idx < 0 and weeks and history is not None:
+        previous = history.previous_week(store.load_roster(result_id), weeks[0][2])
+        if previous is not None:
+            weeks.insert(0, previous)
+    return weeks
+
+def _table_name(week_idx, compare_idx, encoding=None):
+    suffix = f'.{encoding}' if encoding else ''
+    return f"table_{week_idx}_{'prev' if compare_idx is None else compare_idx}{suffix}.pkl"
+
+def _render_args(store, result_id, week_idx, compare_idx):
+    """Arguments for render_attendance_table, or None when either week does not exist."""
+    cube = store.load_cube(result_id)
+    week = store.load_week(result_id, week_idx) if cube else None
+    if week is None:
+        return None
+    compare_week = None
+    if compare_idx is not None:
+        compare_week = store.load_week(result_id, compare_idx) if compare_idx < week_idx else None
+        if compare_week is None:
+            return None
+
+    _, attendance_data, week_name = week
+    # 統計表使用該週自己的人數
+    district_counts, main_district_counts = cube.week_counts(week_idx)
+    return (
+        week_name,
+        attendance_data,
+        _week_with_previous(store, result_id, week_idx, compare_idx),
+        district_counts,
+        main_district_counts,
+        compare_week[2] if compare_week else None
+    )
+
+def get_week_table(result_id, week_idx, compare_idx=None):
+    """
+    Return (html, etag) for one week's attendance table, compared against
+    ``compare_idx`` (an earlier week) or the week before. Rendered tables are
+    cached next to the result, so each (week, comparison) is rendered once per
+    upload. Returns None when either week does not exist.
+    """
+    store = get_result_store()
+    table_name = _table_name(week_idx, compare_idx)
+    cached = store.load_table(result_id, table_name)
+    if cached is not None:
+        return cached
+
+    args = _render_args(store, result_id, week_idx, compare_idx)
+    if args is None:
+        return None
+    with timed('render'):
+        html = render_attendance_table(*args)
+    table = (html, hashlib.sha1(html.encode('utf-8')).hexdigest())
+    store.save_table(result_id, table_name, table)
+    return table
+
+def get_compressed_week_table(result_id, week_idx, compare_idx, encoding, body):
+    """
+    ``body`` (the /get_week_data response for this table) compressed with
+    ``encoding``. Compressed bodies are cached next to the rendered table, so
+    each (week, comparison, encoding) is compressed once per upload.
+    """
+    store = get_result_store()
+    table_name = _table_name(week_idx, compare_idx, encoding)
+    compressed = store.load_table(result_id, table_name)
+    if compressed is None:
+        with timed('compress'):
+            compressed = compress(body, encoding, best=True)
+        store.save_table(result_id, table_name, compressed)
+    return compressed
+
+def iter_week_table(result_id, week_idx):
+    """
+    Streaming counterpart of get_week_table: returns an iterator over the
+    table's HTML, one main-district section at a time, so only one section is
+    held in memory. A cached table is yielded whole. Returns None when the week
+    does not exist.
+    """
+    store = get_result_store()
+    cached = store.load_table(result_id, _table_name(week_idx, None))
+    if cached is not None:
+        return iter([cached[0]])
+
+    args = _render_args(store, result_id, week_idx, None)
+    if args is None:
+        return None
+
+    def sections():
+        empty = True
+        for section in iter_attendance_sections(*args):
+            empty = False
+            yield section
+        if empty:
+            yield NO_DATA_HTML
+    return sections()
+
+def render_all_weeks(result_id):
+    """Render every week (against its previous week) into the table cache."""
+    meta = get_result_store().load_meta(result_id)
+    if meta is None:
+        return
+    try:
+        for week_idx in range(len(meta['weeks'])):
+            get_week_table(result_id, week_idx)
+        logger.info(f"Pre-rendered {len(meta['weeks'])} week tables for result {result_id}")
+    except Exception as e:
+        logger.error(f"Pre-rendering week tables for result {result_id} failed: {str(e)}")
+
+def prerender_weeks(result_id):
+    """Run render_all_weeks in a background thread."""
+    _prerender_executor.submit(render_all_weeks, result_id)
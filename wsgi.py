@@ -0,0 +1,7 @@
+# wsgi.py
+# Production entry point: `gunicorn -c gunicorn.conf.py`. Importing this module
+# in the gunicorn master (preload_app) loads openpyxl, numpy and the compiled
+# templates once, before the workers are forked.
+from app import app, warm_up
+
+warm_up()
@@ -0,0 +1,69 @@
+from config import logger
+
+try:
+    import xlrd
+except ImportError:  # 未安裝 xlrd 時改用 soffice 轉檔
+    xlrd = None
+
+
+class XlsSheet:
+    """Read-only adapter giving an xlrd sheet the openpyxl calls process_excel needs."""
+
+    def __init__(self, sheet, datemode):
+        self._sheet = sheet
+        self._datemode = datemode
+        self.title = sheet.name
+        self.max_row = sheet.nrows
+        self.max_column = sheet.ncols
+
+    def _value(self, cell):
+        if cell.ctype == xlrd.XL_CELL_NUMBER:
+            # BIFF 只存浮點數；整數值轉回 int，與 .xlsx 讀到的值一致
+            return int(cell.value) if cell.value.is_integer() else cell.value
+        if cell.ctype == xlrd.XL_CELL_TEXT:
+            return cell.value
+        if cell.ctype == xlrd.XL_CELL_DATE:
+            try:
+                return xlrd.xldate.xldate_as_datetime(cell.value, self._datemode)
+            except xlrd.xldate.XLDateError:
+                return cell.value
+        if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+            return bool(cell.value)
+        return None  # 空白、錯誤值
+
+    def iter_rows(self, values_only=True):
+        for row_idx in range(self._sheet.nrows):
+            yield tuple(self._value(cell) for cell in self._sheet.row(row_idx))
+
+
+class XlsWorkbook:
+    """Workbook-like wrapper over an in-process parsed .xls (BIFF) file."""
+
+    def __init__(self, book):
+        self._book = book
+        self.worksheets = [XlsSheet(sheet, book.datemode) for sheet in book.sheets()]
+        self.sheetnames = [sheet.title for sheet in self.worksheets]
+        active_idx = next((i for i, sheet in enumerate(book.sheets()) if sheet.sheet_visible), 0)
+        self.active = self.worksheets[active_idx]
+
+    def close(self):
+        self._book.release_resources()
+
+
+def open_xls_workbook(path):
+    """
+    Parse an .xls file in-process; xlrd memory-maps it rather than reading it
+    into a buffer. Returns None when xlrd is unavailable or the file is not
+    something it can read, so the caller can fall back to soffice.
+    """
+    if xlrd is None:
+        logger.info("xlrd not installed; native .xls reader unavailable")
+        return None
+    try:
+        book = xlrd.open_workbook(path, use_mmap=True)
+    except Exception as e:
+        logger.warning(f"Native .xls reader could not parse file: {str(e)}")
+        return None
+    if book.nsheets == 0:
+        return None
+    return XlsWorkbook(book)